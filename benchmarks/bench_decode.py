@@ -0,0 +1,50 @@
+#!/usr/bin/python3.8
+"""
+Per-packet decoding cost of raw SSL-Vision and AutoRef tracked packets,
+comparing the previous exception-driven detection of the packet type with
+the decoder chosen by the packet source
+"""
+from google.protobuf.message import DecodeError
+
+from bench_utils import vision_packet, tracker_packet, measure, print_results
+
+import ssl_wrapper_pb2 as wrapper
+import ssl_vision_wrapper_tracked_pb2 as tigers_wrapper
+from ProcessUDPData import UDPCommunication, VISION_SOURCE, AUTOREF_SOURCE
+
+
+def previous_decode(packet):
+    wrapper_frame = wrapper.SSL_WrapperPacket()
+    try:
+        wrapper_frame.ParseFromString(packet)
+        geometry_data = None
+        for field in wrapper_frame.ListFields():
+            if field[0].name == 'geometry':
+                geometry_data = wrapper_frame.geometry
+        return (True, wrapper_frame.detection, geometry_data)
+    except DecodeError:
+        tigers_wrapper_frame = tigers_wrapper.TrackerWrapperPacket()
+        tigers_wrapper_frame.ParseFromString(packet)
+        return (True, tigers_wrapper_frame.tracked_frame, None)
+
+
+def main():
+    raw_packet = vision_packet(n_robots=8)
+    tracked_packet = tracker_packet(n_robots=8)
+
+    udp = UDPCommunication.__new__(UDPCommunication)
+    udp.init_buffers()
+
+    print_results([
+        ('vision, exception-driven',
+         measure(lambda: previous_decode(raw_packet), 5000)),
+        ('vision, by source',
+         measure(lambda: udp.process_vision_packet(raw_packet, VISION_SOURCE), 5000)),
+        ('autoref, exception-driven',
+         measure(lambda: previous_decode(tracked_packet), 5000)),
+        ('autoref, by source',
+         measure(lambda: udp.process_vision_packet(tracked_packet, AUTOREF_SOURCE), 5000))])
+
+
+if __name__ == '__main__':
+    main()
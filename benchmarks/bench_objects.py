@@ -0,0 +1,140 @@
+#!/usr/bin/python3.8
+"""
+Memory and throughput of the slotted Position/Robot/Challenge_Data types
+compared with the previous dict-backed classes: creation, the update of a
+robot with a new detection and the pickling of the challenge positions that
+are sent to the UI
+"""
+import pickle
+import tracemalloc
+from math import pi
+
+from bench_utils import measure, print_results
+
+from aux.RobotBall import Position, Robot, BLUE_TEAM
+from aux.position_robot import Challenge_Data
+
+N_OBJECTS = 10000
+N_TARGETS = 32
+MAX_FRAMES_UNSEEN = 50  # visibility of the previous classes
+
+
+class PreviousPosition(object):
+    def __init__(self, x=1e12, y=1e12, orientation=0):
+        self.x = x
+        self.y = y
+        self.orientation = float(orientation)
+
+
+class PreviousRobot(object):
+    def __init__(self, **kargs):
+        self.unseen_frames = 0
+        self.pos = PreviousPosition()
+        self.id = -1
+        self.team = BLUE_TEAM
+
+        for key, value in kargs.items():
+            if key == 'robot_id':
+                self.id = value
+            elif key == 'team':
+                self.team = value
+            elif key == 'obj':
+                self.pos = PreviousPosition(*tuple(value['pos']))
+            elif key == 'id':
+                self.id = value['number']
+                self.team = value['color']
+
+    def in_vision(self) -> bool:
+        return self.unseen_frames > 0
+
+    def update(self, **kargs):
+        is_robot = False
+        pos = None
+
+        for key, value in kargs.items():
+            if key == 'id':
+                if value['number'] == self.id and value['color'] == self.team:
+                    is_robot = True
+            elif key == 'obj':
+                pos = PreviousPosition(*tuple(value['pos']))
+
+        if is_robot and pos != None:
+            self.pos = pos
+            self.unseen_frames = MAX_FRAMES_UNSEEN
+        elif self.in_vision():
+            self.unseen_frames = self.unseen_frames - 1
+
+
+class PreviousChallengeData(PreviousRobot):
+    def __init__(self):
+        super().__init__()
+        self.ok = False
+        self.type = BLUE_TEAM
+
+
+def bytes_per_object(create, n=N_OBJECTS) -> float:
+    tracemalloc.start()
+    objects = [create() for _ in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / n
+
+
+def targets(challenge_class) -> list:
+    data = [challenge_class() for _ in range(N_TARGETS)]
+    for robot_id, target in enumerate(data):
+        target.id = robot_id
+        target.pos.x = 300.0 * robot_id
+        target.pos.y = 1000.0
+        target.pos.orientation = pi / 2
+    return data
+
+
+def main():
+    detection = {'id': {'number': 3, 'color': BLUE_TEAM},
+                 'obj': {'pos': [100.0, -250.0, 0.5]}}
+    previous_robot = PreviousRobot(team=BLUE_TEAM, robot_id=3)
+    robot = Robot(team=BLUE_TEAM, robot_id=3)
+    previous_targets = targets(PreviousChallengeData)
+    slotted_targets = targets(Challenge_Data)
+
+    print('{:<48} {:>12} {:>14}'.format('Object', 'bytes', 'pickled bytes'))
+    for name, create, data in (
+            ('Position, dict-backed', PreviousPosition, None),
+            ('Position, slotted', Position, None),
+            ('Robot, dict-backed',
+             lambda: PreviousRobot(team=BLUE_TEAM, robot_id=1), None),
+            ('Robot, slotted', lambda: Robot(team=BLUE_TEAM, robot_id=1), None),
+            ('32 Challenge_Data, dict-backed',
+             lambda: targets(PreviousChallengeData), previous_targets),
+            ('32 Challenge_Data, slotted',
+             lambda: targets(Challenge_Data), slotted_targets)):
+        if data != None:
+            size = bytes_per_object(create, N_OBJECTS // N_TARGETS)
+        else:
+            size = bytes_per_object(create)
+        pickled = len(pickle.dumps(data if data != None else create()))
+        print('{:<48} {:>12.0f} {:>14}'.format(name, size, pickled))
+    print()
+
+    print_results([
+        ('Robot(), dict-backed',
+         measure(lambda: PreviousRobot(team=BLUE_TEAM, robot_id=1))),
+        ('Robot(), slotted',
+         measure(lambda: Robot(team=BLUE_TEAM, robot_id=1))),
+        ('Robot.update(**kargs), dict-backed',
+         measure(lambda: previous_robot.update(**detection))),
+        ('Robot.update(**kargs), slotted',
+         measure(lambda: robot.update(**detection))),
+        ('Robot.update_pos(x, y, orientation), slotted',
+         measure(lambda: robot.update_pos(100.0, -250.0, 0.5))),
+        ('pickle 32 Challenge_Data, dict-backed',
+         measure(lambda: pickle.dumps(previous_targets), 5000)),
+        ('pickle 32 Challenge_Data, slotted',
+         measure(lambda: pickle.dumps(slotted_targets), 5000)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
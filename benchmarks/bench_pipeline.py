@@ -0,0 +1,146 @@
+#!/usr/bin/python3.8
+"""
+Cost of every stage from a serialized vision packet to the world state, the
+positioning checks and the UI messages, for 1 to 16 robots per team:
+
+    python3 benchmarks/bench_pipeline.py --robots 1 8 16 --output results.json
+"""
+import argparse
+from multiprocessing import Process, Queue
+
+from bench_utils import vision_packet, challenge_file, PacketSource, measure, \
+    print_results, save_results
+
+import ssl_wrapper_pb2 as wrapper
+from ProcessUDPData import UDPCommunication, GeometryCache, VISION_SOURCE
+from ChallengeManager import HWChallengeManager, SpecialBotPosition
+from DrawSSL import DrawSSL
+
+from aux.field_model import FieldModel
+from aux.position_robot import PositionFSM
+from aux.RobotBall import BLUE_TEAM, YELLOW_TEAM
+
+DEFAULT_ROBOTS = [1, 2, 4, 8, 16]
+
+
+def drain(queue: Queue):
+    while True:
+        msg = queue.get()
+        if 'END' in msg:
+            return
+
+
+def make_draw() -> DrawSSL:
+    """
+    DrawSSL without the pygame window, a process only empties the queue
+    """
+    draw = DrawSSL()
+    draw.process_queue = Queue(16*3 + 5)
+    draw.process = Process(target=drain, args=(draw.process_queue,),
+                           daemon=True)
+    draw.process.start()
+    return draw
+
+
+def make_manager(n_robots: int, draw: DrawSSL) -> HWChallengeManager:
+    """
+    HWChallengeManager without sockets, GC and UI process
+    """
+    manager = HWChallengeManager.__new__(HWChallengeManager)
+    manager.udp_communication = PacketSource()
+    manager.draw = draw
+    manager.stats_period = 0
+    manager.latency_compensation = False
+    manager.last_stats_print = 0
+
+    manager.position_fsm = PositionFSM(challenge_file(n_robots))
+    manager.position_fsm.set_challenge(1)
+    manager.challenge_number = 1
+    manager.challenge_running = False
+
+    manager.challenge_3_bot_pos = [SpecialBotPosition(), SpecialBotPosition()]
+    # The robots must stay visible while the checks are measured
+    manager.init_world(visibility_timeout=float('inf'))
+    return manager
+
+
+def bench_robots(n_robots: int, draw: DrawSSL) -> [(str, dict)]:
+    packet = vision_packet(n_robots)
+    geometry_packet = vision_packet(n_robots, with_geometry=True)
+
+    udp = UDPCommunication.__new__(UDPCommunication)
+    udp.init_buffers()
+    frame = wrapper.SSL_WrapperPacket()
+    frame.ParseFromString(packet)
+    frame = frame.detection
+
+    wrapper_packet = wrapper.SSL_WrapperPacket()
+    wrapper_packet.ParseFromString(geometry_packet)
+    geometry = wrapper_packet.geometry
+    geometry_cache = GeometryCache()
+    geometry_cache.update(geometry)
+
+    manager = make_manager(n_robots, draw)
+
+    def update_vision_data():
+        manager.udp_communication.pending.append(packet)
+        manager.update_vision_data()
+
+    # Fill the world state once so the positioning checks have robots
+    update_vision_data()
+    world = manager.world
+    challenge_positions = manager.position_fsm.get_challenge_positions()
+
+    def enqueue_ui_data():
+        draw.update_ball(world.ball)
+        draw.update_robots(world.team(BLUE_TEAM))
+        draw.update_robots(world.team(YELLOW_TEAM))
+        draw.update_challenge_data(challenge_positions)
+        draw.update_deviations(manager.position_fsm.get_deviations())
+
+    name = f'[{n_robots:2d}] '
+    return [
+        (name + 'process_vision_packet',
+         measure(lambda: udp.process_vision_packet(packet, VISION_SOURCE))),
+        (name + 'detection_frame_to_array',
+         measure(lambda: udp.detection_frame_to_array(frame))),
+        (name + 'GeometryCache.update (unchanged)',
+         measure(lambda: geometry_cache.update(geometry))),
+        (name + 'FieldModel.from_geometry',
+         measure(lambda: FieldModel.from_geometry(geometry.field), 2000)),
+        (name + 'update_vision_data',
+         measure(update_vision_data, 2000)),
+        (name + 'PositionMatcher.match',
+         measure(lambda: manager.position_fsm.matcher.match(world), 2000)),
+        (name + 'PositionFSM.update_positions',
+         measure(lambda: manager.position_fsm.update_positions(world),
+                 2000)),
+        (name + 'DrawSSL enqueue (ball, robots, targets, deviations)',
+         measure(enqueue_ui_data, 2000)),
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-r', '--robots', required=False, type=int,
+                            nargs='+', default=DEFAULT_ROBOTS,
+                            help='Robots per team, default is {}'.format(
+                                DEFAULT_ROBOTS))
+    arg_parser.add_argument('-o', '--output', required=False, default=None,
+                            help='JSON file where the results are saved')
+    args = arg_parser.parse_args()
+
+    draw = make_draw()
+    results = []
+    for n_robots in args.robots:
+        results.extend(bench_robots(n_robots, draw))
+    draw.process_queue.put({'END': True})
+    draw.process.join()
+
+    print_results(results)
+    if args.output != None:
+        save_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/python3.8
+"""
+Receive path microbenchmark: one vision datagram is sent through a local
+socket pair and then received and decoded, comparing the previous path
+(recv + new protobuf messages per packet) with UDPCommunication's
+(recv_into + reused messages)
+"""
+import socket
+
+from bench_utils import vision_packet, measure, print_results
+
+import ssl_vision_detection_tracked_pb2 as tigers_detection
+import ssl_vision_geometry_pb2 as geometry
+import ssl_wrapper_pb2 as wrapper
+import ssl_vision_wrapper_tracked_pb2 as tigers_wrapper
+from ProcessUDPData import UDPCommunication, VISION_SOURCE, MAX_PACKET_SIZE
+
+
+def main():
+    sender, receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    packet = vision_packet(n_robots=8)
+
+    def previous_path():
+        sender.send(packet)
+        data = receiver.recv(MAX_PACKET_SIZE)
+        wrapper_frame = wrapper.SSL_WrapperPacket()
+        tigers_detection.TrackedFrame()
+        tigers_wrapper.TrackerWrapperPacket()
+        geometry.SSL_GeometryData()
+        wrapper_frame.ParseFromString(data)
+        wrapper_frame.ListFields()
+        return wrapper_frame.detection
+
+    udp = UDPCommunication.__new__(UDPCommunication)
+    udp.init_buffers()
+
+    def current_path():
+        sender.send(packet)
+        data = udp.receive_packet(receiver, VISION_SOURCE)
+        return udp.process_vision_packet(data)
+
+    print_results([('recv + new messages', measure(previous_path)),
+                   ('recv_into + reused messages', measure(current_path))])
+
+    sender.close()
+    receiver.close()
+
+
+if __name__ == '__main__':
+    main()
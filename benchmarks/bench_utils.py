@@ -0,0 +1,171 @@
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import ssl_wrapper_pb2 as wrapper  # noqa: E402
+import ssl_vision_wrapper_tracked_pb2 as tigers_wrapper  # noqa: E402
+from ProcessUDPData import UDPCommunication, VISION_SOURCE  # noqa: E402
+
+
+def vision_packet(n_robots=6, camera_id=0, frame_number=1, t_capture=1.0,
+                  with_geometry=False) -> bytes:
+    """
+    Serialized SSL_WrapperPacket with n_robots per team and one ball
+    """
+    packet = wrapper.SSL_WrapperPacket()
+    frame = packet.detection
+    frame.frame_number = frame_number
+    frame.t_capture = t_capture
+    frame.t_sent = t_capture + 0.002
+    frame.camera_id = camera_id
+
+    ball = frame.balls.add()
+    ball.confidence = 0.9
+    ball.x, ball.y = 100.0, -50.0
+    ball.pixel_x, ball.pixel_y = 0.0, 0.0
+
+    for robots, y in ((frame.robots_blue, 1000.0), (frame.robots_yellow, -1000.0)):
+        for robot_id in range(n_robots):
+            robot = robots.add()
+            robot.confidence = 0.9
+            robot.robot_id = robot_id
+            robot.x, robot.y = 300.0 * robot_id - 2000.0, y
+            robot.orientation = 0.1 * robot_id
+            robot.pixel_x, robot.pixel_y = 0.0, 0.0
+
+    if with_geometry:
+        field = packet.geometry.field
+        field.field_length, field.field_width = 12000, 9000
+        field.goal_width, field.goal_depth = 1800, 180
+        field.boundary_width = 300
+        field.penalty_area_depth, field.penalty_area_width = 1800, 3600
+
+    return packet.SerializeToString()
+
+
+def tracker_packet(n_robots=6, frame_number=1, timestamp=1.0) -> bytes:
+    """
+    Serialized TrackerWrapperPacket (AutoRef tracked data) with n_robots per
+    team and one ball
+    """
+    packet = tigers_wrapper.TrackerWrapperPacket()
+    packet.uuid = 'benchmark'
+    frame = packet.tracked_frame
+    frame.frame_number = frame_number
+    frame.timestamp = timestamp
+
+    ball = frame.balls.add()
+    ball.pos.x, ball.pos.y, ball.pos.z = 0.1, -0.05, 0.0
+    ball.vel.x, ball.vel.y, ball.vel.z = 0.0, 0.0, 0.0
+
+    for team, y in ((2, 1.0), (1, -1.0)):
+        for robot_id in range(n_robots):
+            robot = frame.robots.add()
+            robot.robot_id.id = robot_id
+            robot.robot_id.team = team
+            robot.pos.x, robot.pos.y = 0.3 * robot_id - 2.0, y
+            robot.orientation = 0.1 * robot_id
+            robot.vel.x, robot.vel.y = 0.0, 0.0
+            robot.vel_angular = 0.0
+
+    return packet.SerializeToString()
+
+
+def challenge_file(n_robots=6, filename='/tmp/bench_challenge.json') -> str:
+    """
+    Challenge JSON with the robots of vision_packet(n_robots) as targets. The
+    ball target is somewhere else, so the positioning is never complete
+    """
+    bots = []
+    for color, y in (('BLUE', 1000), ('YELLOW', -1000)):
+        bots.extend([{'obj': {'pos': [300 * robot_id - 2000, y, 0.1 * robot_id]},
+                      'id': {'number': robot_id, 'color': color}}
+                     for robot_id in range(n_robots)])
+
+    with open(filename, 'w') as json_file:
+        json.dump({'ball': {'pos': [0, 0, 0]}, 'bots': bots}, json_file)
+    return filename
+
+
+class PacketSource(UDPCommunication):
+    """
+    UDPCommunication without sockets, the vision packets are taken from
+    self.pending
+    """
+
+    def __init__(self, batch_vision=True):
+        self.pending = []
+        super().__init__(0, '', 0, '', False, batch_vision)
+
+    def init_sockets(self, v_port: int, v_group: str, r_port: int,
+                     r_group: str, rcvbuf_sizes: dict):
+        self.v_socket = None
+        self.autoref_socket = None
+        self.r_socket = None
+
+    def get_vision_packet(self):
+        if len(self.pending) > 0:
+            self.rx_times[VISION_SOURCE] = time.monotonic()
+            return self.pending.pop()
+        return None
+
+
+def measure(fn, n=10000) -> dict:
+    """
+    Runs fn n times and returns the time per call, the transient memory
+    allocated per call and how many GC collections happened
+    """
+    for _ in range(min(n, 100)):
+        fn()
+
+    gc.collect()
+    collections = [0]
+
+    def count_collections(phase, info):
+        if phase == 'start':
+            collections[0] += 1
+
+    gc.callbacks.append(count_collections)
+    t_start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    dt = time.perf_counter() - t_start
+    gc.callbacks.remove(count_collections)
+
+    # Memory is measured in a separated run, tracemalloc slows everything down
+    n_mem = min(n, 1000)
+    tracemalloc.start()
+    peak_sum = 0
+    for _ in range(n_mem):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        peak_sum += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    return {'us_per_op': 1e6 * dt / n,
+            'ops_per_s': n / dt,
+            'bytes_per_op': peak_sum / n_mem,
+            'gc_per_10k': 1e4 * collections[0] / n}
+
+
+def print_results(results: [(str, dict)]):
+    print('{:<48} {:>12} {:>14} {:>14} {:>12}'.format(
+        'Benchmark', 'us/op', 'ops/s', 'bytes/op', 'GC/10k ops'))
+    for name, result in results:
+        print('{:<48} {:>12.2f} {:>14.0f} {:>14.0f} {:>12.1f}'.format(
+            name, result['us_per_op'], result['ops_per_s'],
+            result['bytes_per_op'], result['gc_per_10k']))
+
+
+def save_results(results: [(str, dict)], filename: str):
+    with open(filename, 'w') as json_file:
+        json.dump(dict(results), json_file, indent=4)
+    print(f'Results saved to {filename}')
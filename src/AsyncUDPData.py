@@ -0,0 +1,160 @@
+import asyncio
+import time
+from collections import deque
+from tabulate import tabulate
+
+from ProcessUDPData import UDPCommunication, VISION_SOURCE, AUTOREF_SOURCE, \
+    REFEREE_SOURCE, MAX_PACKETS_PER_TICK
+
+from aux.utils import red_print, blue_print, green_print, purple_print
+
+
+class DatagramSource(asyncio.DatagramProtocol):
+    """
+    Receives the datagrams of one socket (vision, autoref or referee) and
+    keeps them until the world state consumer reads them. When the queue is
+    full the oldest datagram is overwritten and counted as an overrun
+    """
+
+    def __init__(self, source: str, data_ready: asyncio.Event, record=None):
+        self.source = source
+        self.data_ready = data_ready
+        self.record = record  # called with every datagram while recording
+        self.packets = deque(maxlen=MAX_PACKETS_PER_TICK)
+        self.transport = None
+        self.received = 0
+        self.overruns = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        rx_time = time.monotonic()
+        if len(self.packets) == self.packets.maxlen:
+            self.overruns += 1
+        self.packets.append((data, rx_time))
+        self.received += 1
+        if self.record != None:
+            self.record(self.source, data, rx_time)
+        self.data_ready.set()
+
+    def error_received(self, exc):
+        red_print(f'[UDP] {self.source}', exc)
+
+    def has_data(self) -> bool:
+        return len(self.packets) > 0
+
+    def pop(self) -> (bytes, float):
+        """
+        Returns the oldest datagram and its monotonic receive time
+        """
+        if len(self.packets) > 0:
+            return self.packets.popleft()
+        return (None, None)
+
+# =============================================================================
+
+
+class AsyncUDPCommunication(UDPCommunication):
+    """
+    asyncio version of UDPCommunication, each socket is served by a
+    DatagramSource in the running event loop instead of being read directly
+    """
+
+    def __init__(self, v_port: int, v_group: str, r_port: int, r_group: str,
+                 use_autoref: bool, batch_vision=True, rcvbuf_sizes=None):
+        super().__init__(v_port, v_group, r_port, r_group, use_autoref,
+                         batch_vision, rcvbuf_sizes)
+        # The transports use recvfrom, the ancillary data is not available
+        self.drop_accounting = False
+        self.data_ready = None
+        self.protocols = dict()
+        self.readers = []
+        # (received, overruns) of the queues of the stopped protocols
+        self.queue_counters = {source: (0, 0) for source in self.buffers}
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.data_ready = asyncio.Event()
+
+        for source, socket_obj in self.get_selectables():
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda source=source: DatagramSource(source, self.data_ready,
+                                                     self.record_packet),
+                sock=socket_obj)
+            self.protocols[source] = protocol
+        green_print('[UDP] asyncio backend started!')
+
+    def stop(self):
+        loop = asyncio.get_running_loop()
+        for fileobj in self.readers:
+            loop.remove_reader(fileobj)
+        self.readers = []
+
+        for source, protocol in self.protocols.items():
+            if protocol.transport != None:
+                protocol.transport.close()
+            self.queue_counters[source] = self.get_queue_counters(source)
+        self.protocols = dict()
+
+    def get_queue_counters(self, source: str) -> (int, int):
+        received, overruns = self.queue_counters[source]
+        protocol = self.protocols.get(source)
+        if protocol != None:
+            received += protocol.received
+            overruns += protocol.overruns
+        return (received, overruns)
+
+    def get_socket_stats(self) -> dict:
+        stats = super().get_socket_stats()
+        for source, source_stats in stats.items():
+            source_stats['queue_overruns'] = self.get_queue_counters(source)[1]
+        return stats
+
+    def print_stats(self):
+        super().print_stats()
+        header = ['Source', 'Received', 'Queue Overruns']
+        data = [[source] + list(self.get_queue_counters(source))
+                for source in self.rcvbuf_sizes]
+        blue_print(tabulate(data, header), '\n')
+
+    def add_reader(self, fileobj):
+        """
+        Wakes up wait_ready when fileobj (e.g. the UI pipe) becomes readable
+        """
+        asyncio.get_running_loop().add_reader(fileobj, self.data_ready.set)
+        self.readers.append(fileobj)
+
+# =============================================================================
+
+    async def wait_ready(self, timeout: float) -> [str]:
+        if len(self.pending_sources()) == 0:
+            try:
+                await asyncio.wait_for(self.data_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.data_ready.clear()
+        return self.pending_sources()
+
+    def pending_sources(self) -> [str]:
+        return [source for source, protocol in self.protocols.items()
+                if protocol.has_data()]
+
+# =============================================================================
+
+    def get_vision_packet(self):
+        return self.pop_packet(VISION_SOURCE)
+
+    def get_autoref_vision_packet(self):
+        return self.pop_packet(AUTOREF_SOURCE)
+
+    def get_referee_packet(self):
+        return self.pop_packet(REFEREE_SOURCE)
+
+    def pop_packet(self, source: str):
+        if source in self.protocols:
+            packet, rx_time = self.protocols[source].pop()
+            if packet != None:
+                self.rx_times[source] = rx_time
+            return packet
+        return None
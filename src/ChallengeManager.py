@@ -1,20 +1,31 @@
 #!/usr/bin/python3.8
 import json
 import argparse
+import asyncio
+import selectors
 import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from os.path import isfile
 
 from ProcessUDPData import UDPCommunication, DEFAULT_VISION_PORT, DEFAULT_VISION_IP, \
-    DEFAULT_REFEREE_PORT, DEFAULT_REFEREE_IP
+    DEFAULT_REFEREE_PORT, DEFAULT_REFEREE_IP, VISION_SOURCE, AUTOREF_SOURCE, \
+    REFEREE_SOURCE, DEFAULT_RCVBUF_SIZES, DEFAULT_SOURCE_PRIORITY
+from AsyncUDPData import AsyncUDPCommunication
+from ThreadedUDPData import ThreadedUDPCommunication
+from ReplayUDPData import ReplayUDPCommunication
 from DrawSSL import DrawSSL
 
-from aux.GCSocket import GCCommands, GCSocket
+from aux.GCSocket import GCCommands, GCSocket, DryRunGCSocket
 from aux.position_robot import PositionFSM
 
-from aux.RobotBall import Robot, Ball, Position, BLUE_TEAM, YELLOW_TEAM, \
-    DISTANCE_THRESHOLD, INF
+from aux.RobotBall import Position, BLUE_TEAM, YELLOW_TEAM, \
+    DISTANCE_THRESHOLD, INF, VISIBILITY_TIMEOUT
+from aux.world_state import WorldState, BallView
+from aux.source_arbiter import DEFAULT_STALENESS
 from aux.utils import red_print, blue_print, green_print, purple_print
+from aux.stdin_reader import StdinReader, CONFIRM_EVENT
+from aux import clock
 
 from aux.hw_challenge_fsm import ChallengeFSM, ROBOT_STOP_TRESHOLD
 from aux.challenge_aux import ChallengeEvents
@@ -22,6 +33,14 @@ from aux.challenge_aux import ChallengeEvents
 DEBUG = False
 MAX_ROBOTS = 16
 
+UI_SOURCE = 'UI'
+STDIN_SOURCE = 'STDIN'
+MAX_SELECT_TIMEOUT = 0.5  # in seconds
+
+SELECT_BACKEND = 'select'
+ASYNCIO_BACKEND = 'asyncio'
+THREAD_BACKEND = 'thread'
+
 
 class SpecialBotPosition(Position):
     def __init__(self):
@@ -33,14 +52,56 @@ class HWChallengeManager(object):
     def __init__(self):
         args = self.parse_args()
         self.running = False
-
-        self.udp_communication = UDPCommunication(v_port=int(args['vision_port']),
-                                                  v_group=args['vision_ip'],
-                                                  r_port=int(
-                                                      args['referee_port']),
-                                                  r_group=args['referee_ip'],
-                                                  use_autoref=bool(int(args['use_autoref_data'])))
-        self.gc_socket = GCSocket()
+        self.backend = args['backend']
+        self.replay_file = args['replay']
+        if self.replay_file != None:
+            # The replay is driven by the selector timeouts
+            self.backend = SELECT_BACKEND
+
+        if self.backend == ASYNCIO_BACKEND:
+            udp_class = AsyncUDPCommunication
+        elif self.backend == THREAD_BACKEND:
+            udp_class = ThreadedUDPCommunication
+        else:
+            udp_class = UDPCommunication
+
+        self.latency_compensation = bool(int(args['latency_compensation']))
+        self.visibility_timeout = float(args['visibility_timeout'])
+        self.stats_file = args['stats_file']
+        self.stats_period = float(args['stats_period'])
+        self.last_stats_print = time.monotonic()
+
+        if self.replay_file != None:
+            self.udp_communication = ReplayUDPCommunication(
+                self.replay_file, speed=float(args['replay_speed']),
+                start=float(args['replay_start']),
+                use_autoref=bool(int(args['use_autoref_data'])),
+                batch_vision=bool(int(args['batch_vision_data'])))
+        else:
+            self.udp_communication = udp_class(v_port=int(args['vision_port']),
+                                               v_group=args['vision_ip'],
+                                               r_port=int(args['referee_port']),
+                                               r_group=args['referee_ip'],
+                                               use_autoref=bool(
+                                                   int(args['use_autoref_data'])),
+                                               batch_vision=bool(int(args['batch_vision_data'])),
+                                               rcvbuf_sizes={VISION_SOURCE: int(args['vision_rcvbuf']),
+                                                             AUTOREF_SOURCE: int(args['autoref_rcvbuf']),
+                                                             REFEREE_SOURCE: int(args['referee_rcvbuf'])})
+
+        self.udp_communication.set_source_priority(
+            args['source_priority'],
+            {VISION_SOURCE: float(args['vision_staleness']),
+             AUTOREF_SOURCE: float(args['autoref_staleness'])})
+
+        if args['record'] != None:
+            self.udp_communication.start_recording(args['record'])
+
+        if self.replay_file != None:
+            self.gc_socket = DryRunGCSocket()
+        else:
+            self.gc_socket = GCSocket()
+        self.gc_executor = None  # only used by the asyncio backend
         self.gc_socket.send_command(GCCommands.HALT)
 
         self.challenge_running = False
@@ -58,12 +119,11 @@ class HWChallengeManager(object):
 
         # Init data
         self.challenge_3_bot_pos = [SpecialBotPosition(), SpecialBotPosition()]
-        self.ball = Ball()
-        self.blue_robots = [Robot(team=BLUE_TEAM, robot_id=i)
-                            for i in range(MAX_ROBOTS)]
-        self.yellow_robots = [Robot(team=YELLOW_TEAM, robot_id=i)
-                              for i in range(MAX_ROBOTS)]
+        self.init_world(self.visibility_timeout)
         self.init_drawings()
+        self.init_stdin_reader()
+        if self.backend != ASYNCIO_BACKEND:
+            self.init_selector()
 
 # =============================================================================
 
@@ -102,90 +162,274 @@ class HWChallengeManager(object):
         arg_parser.add_argument('-A', '--use-autoref-data', required=False,
                                 help='Indicates wheter to use the autoref tracked data (1/0), default is 0',
                                 default=0)
+        arg_parser.add_argument('-b', '--batch-vision-data', required=False,
+                                help='Read every pending vision packet on each iteration, keeping only the newest frame per camera (1/0), default is 1',
+                                default=1)
+        arg_parser.add_argument('-B', '--backend', required=False,
+                                choices=[SELECT_BACKEND, ASYNCIO_BACKEND,
+                                         THREAD_BACKEND],
+                                help='How the sockets are read, default is {}'.format(
+                                    SELECT_BACKEND),
+                                default=SELECT_BACKEND)
+        arg_parser.add_argument('-L', '--latency-compensation', required=False,
+                                help='Extrapolates the robots and the ball with their velocity to the current time before the positioning and stop checks (1/0), default is 0',
+                                default=0)
+        arg_parser.add_argument('--source-priority', required=False,
+                                nargs='+', choices=[AUTOREF_SOURCE, VISION_SOURCE],
+                                help='Sources of detections from the most to the least trusted, default is {}'.format(
+                                    ' '.join(DEFAULT_SOURCE_PRIORITY)),
+                                default=DEFAULT_SOURCE_PRIORITY)
+        arg_parser.add_argument('--vision-staleness', required=False,
+                                help='Seconds without vision frames before falling back to the next source, default is {}'.format(
+                                    DEFAULT_STALENESS),
+                                default=DEFAULT_STALENESS)
+        arg_parser.add_argument('--autoref-staleness', required=False,
+                                help='Seconds without AutoRef frames before falling back to the next source, default is {}'.format(
+                                    DEFAULT_STALENESS),
+                                default=DEFAULT_STALENESS)
+        arg_parser.add_argument('--visibility-timeout', required=False,
+                                help='Seconds without detections before a robot or the ball leaves the vision, default is {}'.format(
+                                    VISIBILITY_TIMEOUT),
+                                default=VISIBILITY_TIMEOUT)
+        arg_parser.add_argument('--vision-rcvbuf', required=False,
+                                help='Kernel receive buffer (SO_RCVBUF) of the vision socket in bytes, default is 0 (system default)',
+                                default=DEFAULT_RCVBUF_SIZES[VISION_SOURCE])
+        arg_parser.add_argument('--autoref-rcvbuf', required=False,
+                                help='Kernel receive buffer (SO_RCVBUF) of the autoref socket in bytes, default is 0 (system default)',
+                                default=DEFAULT_RCVBUF_SIZES[AUTOREF_SOURCE])
+        arg_parser.add_argument('--referee-rcvbuf', required=False,
+                                help='Kernel receive buffer (SO_RCVBUF) of the referee socket in bytes, default is 0 (system default)',
+                                default=DEFAULT_RCVBUF_SIZES[REFEREE_SOURCE])
+        arg_parser.add_argument('--record', required=False,
+                                help='Binary log file where every received vision/autoref/referee datagram is saved',
+                                default=None)
+        arg_parser.add_argument('--replay', required=False,
+                                help='Replays a log saved with --record (or a standard SSL log) instead of using the network, the GC commands are only printed',
+                                default=None)
+        arg_parser.add_argument('--replay-speed', required=False,
+                                help='Replay speed multiplier, 0 replays as fast as possible, default is 1',
+                                default=1)
+        arg_parser.add_argument('--replay-start', required=False,
+                                help='Starts the replay N seconds after the beginning of the log, default is 0',
+                                default=0)
+        arg_parser.add_argument('--stats-period', required=False,
+                                help='Print the per camera latency/loss statistics every N seconds, default is 0 (only on exit)',
+                                default=0)
+        arg_parser.add_argument('--stats-file', required=False,
+                                help='JSON file where the per camera latency/loss statistics are saved on exit',
+                                default=None)
 
         return vars(arg_parser.parse_args())
 
 # =============================================================================
 
+    def init_world(self, visibility_timeout=VISIBILITY_TIMEOUT):
+        self.world = WorldState(MAX_ROBOTS, visibility_timeout)
+        # Read-only Robot/Ball views of the world state
+        self.ball = BallView(self.world)
+        self.blue_robots = self.world.robots(BLUE_TEAM)
+        self.yellow_robots = self.world.robots(YELLOW_TEAM)
+
     def init_drawings(self):
         self.draw = DrawSSL()
         self.draw.start()
         self.running = True
 
+    def init_stdin_reader(self):
+        # The start of the challenge is confirmed with Enter in the console
+        self.stdin_reader = StdinReader()
+        self.stdin_reader.start()
+
+    def init_selector(self):
+        self.selector = selectors.DefaultSelector()
+        for source, fileobj in self.udp_communication.get_selectables():
+            self.selector.register(fileobj, selectors.EVENT_READ, source)
+        self.selector.register(self.draw.get_ui_fileobj(), selectors.EVENT_READ,
+                               UI_SOURCE)
+        self.selector.register(self.stdin_reader.get_fileobj(),
+                               selectors.EVENT_READ, STDIN_SOURCE)
+
+# =============================================================================
+
+    def next_timeout(self) -> float:
+        timeout = MAX_SELECT_TIMEOUT
+        if self.challenge_running:
+            deadline = self.manager_fsm.time_to_next_step()
+            if deadline != None:
+                timeout = min(timeout, deadline)
+
+        packet_timeout = self.udp_communication.next_packet_timeout()
+        if packet_timeout != None:
+            timeout = min(timeout, packet_timeout)
+        return timeout
+
+    def run(self):
+        # The log is closed even on Ctrl+C, so the queued records and the
+        # index are saved
+        try:
+            if self.backend == ASYNCIO_BACKEND:
+                asyncio.run(self.run_async())
+            else:
+                self.run_select()
+            self.udp_communication.print_stats()
+        finally:
+            self.udp_communication.stop_recording()
+
+        if self.stats_file != None:
+            self.udp_communication.vision_stats.export(
+                self.stats_file, self.udp_communication.get_socket_stats())
+
+    def run_select(self):
+        if self.backend == THREAD_BACKEND:
+            self.udp_communication.start()
+
+        try:
+            while self.running and not self.udp_communication.is_finished():
+                if not self.spin_once():
+                    break
+        finally:
+            self.selector.close()
+
+            if self.backend == THREAD_BACKEND:
+                self.udp_communication.stop()
+
+    async def run_async(self):
+        """
+        Runs the manager inside an already running event loop, GC commands and
+        challenge timers are handled by this coroutine
+        """
+        await self.udp_communication.start()
+        self.udp_communication.add_reader(self.draw.get_ui_fileobj())
+        self.udp_communication.add_reader(self.stdin_reader.get_fileobj())
+        # The GC websocket is blocking, the commands are sent from a single
+        # worker thread (in order) so they don't stall the event loop
+        self.gc_executor = ThreadPoolExecutor(max_workers=1)
+
+        try:
+            while self.running:
+                if not await self.spin_once_async():
+                    break
+        finally:
+            self.udp_communication.stop()
+            # Waits for the last commands (e.g. the final HALT)
+            self.gc_executor.shutdown(wait=True)
+            self.gc_executor = None
+
+    def spin_once(self) -> bool:
+        """
+        Blocks until a socket or the UI has data or the challenge FSM needs to
+        advance, then processes whatever is ready. Returns False on quit
+        """
+        ready = [key.data
+                 for key, _ in self.selector.select(self.next_timeout())]
+        return self.process_ready(self.udp_communication.ready_sources(ready))
+
+    async def spin_once_async(self) -> bool:
+        ready = await self.udp_communication.wait_ready(self.next_timeout())
+        if self.draw.get_ui_fileobj().poll():
+            ready.append(UI_SOURCE)
+        if self.stdin_reader.get_fileobj().poll():
+            ready.append(STDIN_SOURCE)
+        return self.process_ready(ready)
+
+    def process_ready(self, ready: [str]) -> bool:
+        if VISION_SOURCE in ready or AUTOREF_SOURCE in ready:
+            self.update_vision_data()
+
+        if REFEREE_SOURCE in ready:
+            self.update_referee_data()
+
+        if self.challenge_running:
+            self.run_challenge()
+
+        if STDIN_SOURCE in ready and \
+                self.stdin_reader.get_event() == CONFIRM_EVENT:
+            self.confirm_start()
+
+        if UI_SOURCE in ready:
+            ui_event = self.draw.get_ui_event()
+            if ui_event == 'QUIT':
+                return False
+            elif ui_event == CONFIRM_EVENT:
+                self.confirm_start()
+        return True
+
+    def confirm_start(self):
+        """
+        The operator confirmed the start, the positions are checked again
+        with the current world state
+        """
+        self.position_fsm.confirm(self.world, self.prediction_time())
+
 # =============================================================================
 
     def update_vision_data(self):
-        vision_data, geometry_data = self.udp_communication.get_vision_socket_data()
-
-        if geometry_data != None and 'field_size' in geometry_data.keys() and \
-                'center_circle' in geometry_data.keys():
-            self.draw.set_field_size(geometry_data['field_size'])
-            self.draw.set_center_circle_radius(geometry_data['center_circle'])
-
-        if vision_data != None:
-            data_keys = list(vision_data.keys())
-            if 'ball' in data_keys:
-                self.ball.update(pos=vision_data['ball'])
-                self.draw.update_ball(self.ball.pos)
-
-            blue_bots = []
-            yellow_bots = []
-            if 'bots' in data_keys:
-                for robot in vision_data['bots']:
-                    for r_id in range(MAX_ROBOTS):
-                        self.blue_robots[r_id].update(obj=robot['obj'],
-                                                      id=robot['id'])
-
-                        if r_id == self.position_fsm.json_blue_id:
-                            self.update_challenge_3_bot_position(
-                                self.blue_robots[r_id].pos,
-                                self.position_fsm.get_pos(r_id, BLUE_TEAM))
-
-                        self.yellow_robots[r_id].update(obj=robot['obj'],
-                                                        id=robot['id'])
-                # In case there are no robots in the field, make sure they get
-                # their 'in_vision' state updated
-                if len(vision_data['bots']) == 0:
-                    for r_id in range(MAX_ROBOTS):
-                        self.blue_robots[r_id].update(
-                            id={'number': r_id, 'color': BLUE_TEAM})
-                        self.yellow_robots[r_id].update(
-                            id={'number': r_id, 'color': YELLOW_TEAM})
-
-                blue_bots.extend([bot for bot in self.blue_robots
-                                  if bot.in_vision()])
-                yellow_bots.extend([bot for bot in self.yellow_robots
-                                    if bot.in_vision()])
-
-            self.draw.update_robots(blue_bots, BLUE_TEAM)
-            self.draw.update_robots(yellow_bots, YELLOW_TEAM)
+        vision_data, field_model = self.udp_communication.get_vision_socket_data()
+
+        if self.udp_communication.skipped_frames > 0:
+            purple_print('[UDP] Skipped {} stale vision frames (total = {})'.format(
+                self.udp_communication.skipped_frames,
+                self.udp_communication.total_skipped_frames), '\r')
+
+        for event in self.udp_communication.get_source_events():
+            purple_print('[UDP]', event)
+
+        # Only sent when the geometry changes
+        if field_model != None:
+            self.draw.set_field_model(field_model)
+
+        if vision_data is not None:
+            self.world.update(vision_data)
+            if self.world.ball_detected():
+                self.draw.update_ball(self.world.ball)
+
+            r_id = self.position_fsm.json_blue_id
+            if 0 <= r_id < MAX_ROBOTS and self.world.team(BLUE_TEAM).is_visible(r_id):
+                self.update_challenge_3_bot_position(
+                    self.world.position(BLUE_TEAM, r_id, self.prediction_time()),
+                    self.position_fsm.get_pos(r_id, BLUE_TEAM))
+
+            self.draw.update_robots(self.world.team(BLUE_TEAM))
+            self.draw.update_robots(self.world.team(YELLOW_TEAM))
 
             self.check_challenge_positions()
             self.draw.update_challenge_data(
                 self.position_fsm.get_challenge_positions())
+            self.draw.update_deviations(self.position_fsm.get_deviations())
+
+        self.udp_communication.vision_stats.processing_done()
+        if self.stats_period > 0 and \
+                time.monotonic() - self.last_stats_print >= self.stats_period:
+            self.last_stats_print = time.monotonic()
+            self.udp_communication.vision_stats.print_stats()
 
 # =============================================================================
 
     def update_referee_data(self):
-        referee_data = self.udp_communication.get_referee_socket_data()
-        ref_cmd = 'NONE'
-
-        if referee_data != None:
-            ref_cmd = referee_data['Command']
+        for referee_event in self.udp_communication.get_referee_socket_data():
+            if DEBUG:
+                purple_print(referee_event)
 
-        if self.challenge_running:
-            if ref_cmd == 'HALT':
-                purple_print(f'\nReferee Command = {ref_cmd}')
-                self.manager_fsm.challenge_external_event(ChallengeEvents.GOAL)
-            elif ref_cmd == 'STOP':
-                purple_print(f'\nReferee Command = {ref_cmd}')
-                self.manager_fsm.challenge_external_event(ChallengeEvents.STOP)
+            if self.challenge_running:
+                if referee_event.command_changed:
+                    purple_print(
+                        f'\nReferee Command = {referee_event.state.command}')
+                self.manager_fsm.referee_event(referee_event)
 
 # =============================================================================
 
+    def prediction_time(self) -> float:
+        """
+        Time the challenge decisions extrapolate the world state to, in the
+        local monotonic time of the receive times, None when the latency
+        compensation is disabled
+        """
+        if self.latency_compensation:
+            return clock.monotonic()
+        return None
+
     def check_challenge_positions(self):
-        self.position_fsm.update_positions(self.blue_robots,
-                                           self.yellow_robots, self.ball)
+        self.position_fsm.update_positions(self.world, self.prediction_time())
 
     def objects_positioned(self):
         green_print('Start')
@@ -195,12 +439,26 @@ class HWChallengeManager(object):
         gc_command = self.manager_fsm.get_current_command()
 
         if gc_command != GCCommands.NONE:
-            self.gc_socket.send_command(gc_command, BLUE_TEAM)
+            self.send_gc_command(gc_command, BLUE_TEAM)
             purple_print('Sent', gc_command.name)
 
+    def send_gc_command(self, gc_command: GCCommands, team=None):
+        if self.gc_executor == None:
+            self.gc_socket.send_command(gc_command, team)
+            return
+
+        future = self.gc_executor.submit(self.gc_socket.send_command,
+                                         gc_command, team)
+        future.add_done_callback(self.gc_command_done)
+
+    def gc_command_done(self, future):
+        if future.exception() != None:
+            red_print('[W Socket] Failed to send the command:',
+                      future.exception())
+
     def challenge_end(self):
         blue_print('Challenge Ended!')
-        self.gc_socket.send_command(GCCommands.HALT)
+        self.send_gc_command(GCCommands.HALT)
         challenge_time = self.manager_fsm.get_challenge_time()
 
         green_print('Challenge took {:.2f} seconds'.format(challenge_time))
@@ -218,12 +476,12 @@ class HWChallengeManager(object):
             if self.challenge_3_bot_pos[0].t <= 0:
                 if DEBUG:
                     purple_print('Start counting')
-                self.challenge_3_bot_pos[0].t = time.time_ns()/1e9
-                self.challenge_3_bot_pos[1].t = time.time_ns()/1e9
+                self.challenge_3_bot_pos[0].t = clock.now()
+                self.challenge_3_bot_pos[1].t = clock.now()
                 self.challenge_3_bot_pos[0].set_pos(pos)
                 self.challenge_3_bot_pos[1].set_pos(pos)
             else:
-                self.challenge_3_bot_pos[1].t = time.time_ns()/1e9
+                self.challenge_3_bot_pos[1].t = clock.now()
                 self.challenge_3_bot_pos[1].set_pos(pos)
 
             dist = self.challenge_3_bot_pos[1].distance(
@@ -255,16 +513,7 @@ class HWChallengeManager(object):
 if __name__ == "__main__":
     manager = HWChallengeManager()
 
-    while manager.running:
-        manager.update_vision_data()
-        manager.update_referee_data()
-
-        if manager.challenge_running:
-            manager.run_challenge()
-
-        ui_msg = manager.draw.get_ui_event()
-        if ui_msg == 'QUIT':
-            break
+    manager.run()
 
     manager.draw.stop()
     red_print('\nQuit')
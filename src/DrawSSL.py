@@ -3,13 +3,17 @@ import pygame.freetype
 import time
 import numpy as np
 
-from multiprocessing import Process, Queue
+from multiprocessing import Process, Queue, Pipe
+from queue import Full as QueueFullException
 from math import sqrt, acos, pi, trunc, cos, sin
 
-from aux.RobotBall import Robot, Position, BLUE_TEAM, YELLOW_TEAM, BALL, INF,\
+from aux.RobotBall import BLUE_TEAM, YELLOW_TEAM, BALL, INF,\
     DISTANCE_THRESHOLD, ORIENTATION_THRESHOLD
+from aux.world_state import ObjectState
 from aux.utils import red_print, blue_print, green_print, purple_print
 from aux.position_robot import Challenge_Data
+from aux.field_model import FieldModel
+from aux.stdin_reader import CONFIRM_EVENT
 
 FIELD_LINE_PEN_SZ = 6
 SCREEN_SIZE = [800, 600]
@@ -37,10 +41,15 @@ class DrawSSL(object):
 
         self.field_size = np.array([800, 600])
         self.center_circle_radius = 100
+        self.field_model = None
         self.ball = np.array([INF, INF])
-        self.blue_robots = []
-        self.yellow_robots = []
+        # [id, x, y, theta] of the visible robots
+        self.blue_robots = np.empty((0, 4))
+        self.yellow_robots = np.empty((0, 4))
         self.challenge_positions = []
+        self.pending_field_model = None  # not sent yet, the queue was full
+        # [robot x, robot y, target x, target y] of the assigned targets
+        self.deviations = np.empty((0, 4))
 
 # =============================================================================
 
@@ -65,11 +74,14 @@ class DrawSSL(object):
     def event_loop(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                self.ui_queue.put_nowait('QUIT')
+                self.ui_sender.send('QUIT')
 
             elif event.type == pygame.KEYUP:
                 if event.key == pygame.K_q:
-                    self.ui_queue.put_nowait('QUIT')
+                    self.ui_sender.send('QUIT')
+                elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+                    # Confirms the start of the challenge
+                    self.ui_sender.send(CONFIRM_EVENT)
             elif event.type == pygame.WINDOWRESIZED:
                 win_sz = self.window.get_size()
                 global SCREEN_SIZE
@@ -83,11 +95,10 @@ class DrawSSL(object):
             msg = self.process_queue.get_nowait()
             if 'END' in msg.keys() and msg['END']:
                 end_ui = True
-            elif 'FieldSZ' in msg.keys():
-                self.field_size = msg['FieldSZ']
-                end_ui = False
-            elif 'CircleSZ' in msg.keys():
-                self.center_circle_radius = msg['CircleSZ']
+            elif 'Field' in msg.keys():
+                self.field_model = msg['Field']
+                self.field_size = np.array(self.field_model.get_size())
+                self.center_circle_radius = self.field_model.center_circle_radius
                 end_ui = False
             elif 'BallP' in msg.keys():
                 self.ball = msg['BallP']
@@ -101,6 +112,9 @@ class DrawSSL(object):
             elif 'ChallengeP' in msg.keys():
                 self.challenge_positions = msg['ChallengeP']
                 end_ui = False
+            elif 'DeviationP' in msg.keys():
+                self.deviations = msg['DeviationP']
+                end_ui = False
         return end_ui
 
 # =============================================================================
@@ -113,6 +127,7 @@ class DrawSSL(object):
         self.draw_ball(scaled_field)
         self.draw_robots(scaled_field)
         self.draw_challenges_positions(scaled_field)
+        self.draw_deviations(scaled_field)
 
 # =============================================================================
 
@@ -131,10 +146,12 @@ class DrawSSL(object):
 # =============================================================================
 
     def start(self):
-        green_print('[UI] Started!\n\t Press Q/q or close the window to exit!')
-        self.ui_queue = Queue()
+        green_print('[UI] Started!\n\t Press Q/q or close the window to exit!'
+                    '\n\t Press Enter to start the challenge once positioned!')
+        # A pipe can be waited on together with the UDP sockets
+        self.ui_receiver, self.ui_sender = Pipe(duplex=False)
         # 16 = MAX_ROBOTS
-        self.process_queue = Queue(16*3 + 5)
+        self.process_queue = Queue(16*3 + 6)
         self.process = Process(target=self.draw)
 
         self.process.start()
@@ -148,21 +165,34 @@ class DrawSSL(object):
 
 # =============================================================================
 
-    def set_field_size(self, new_size: [int, int]):
-        if self.process.is_alive() and not self.process_queue.full():
-            self.field_size = np.array(new_size)
-            self.process_queue.put_nowait({'FieldSZ': self.field_size})
-
-# =============================================================================
-
-    def set_center_circle_radius(self, radius: int):
-        if self.process.is_alive() and not self.process_queue.full():
-            self.center_circle_radius = radius
-            self.process_queue.put_nowait({'CircleSZ': radius})
+    def set_field_model(self, field_model: FieldModel):
+        """
+        The field model is only sent when the geometry changes, so instead of
+        being dropped when the queue is full it stays pending and is sent
+        with the next UI update
+        """
+        self.field_model = field_model
+        self.field_size = np.array(field_model.get_size())
+        self.center_circle_radius = field_model.center_circle_radius
+        self.pending_field_model = field_model
+        self.send_field_model()
+
+    def send_field_model(self):
+        if self.pending_field_model == None or not self.process.is_alive():
+            return
+        try:
+            self.process_queue.put_nowait({'Field': self.pending_field_model})
+            self.pending_field_model = None
+        except QueueFullException:
+            pass
 
 # =============================================================================
 
     def draw_field(self, scaled_field: np.array):
+        if self.field_model != None:
+            self.draw_field_model(scaled_field)
+            return
+
         adj_border = self.scale_val(FIELD_BORDER)
 
         pygame.draw.rect(self.window, 'white', width=FIELD_LINE_PEN_SZ,
@@ -180,6 +210,27 @@ class DrawSSL(object):
                                                    scaled_field),
                            radius=self.scale_rad(self.center_circle_radius))
 
+    def draw_field_model(self, scaled_field: np.array):
+        pen_sz = round(FIELD_LINE_PEN_SZ/2)
+
+        for line in self.field_model.lines:
+            pygame.draw.line(self.window, 'white', width=pen_sz,
+                             start_pos=self.scale(line.p1, scaled_field),
+                             end_pos=self.scale(line.p2, scaled_field))
+
+        for arc in self.field_model.arcs:
+            center = self.scale(arc.center, scaled_field)
+            radius = self.scale_val(arc.radius)
+            rect = pygame.Rect(center[0] - radius[0], center[1] - radius[1],
+                               2*radius[0], 2*radius[1])
+            pygame.draw.arc(self.window, 'white', rect, arc.a1, arc.a2,
+                            width=pen_sz)
+
+        for goal in self.field_model.goals.values():
+            pygame.draw.lines(self.window, BLACK_C, False,
+                              [self.scale(point, scaled_field)
+                               for point in goal], width=pen_sz)
+
 
 # =============================================================================
 
@@ -194,17 +245,13 @@ class DrawSSL(object):
 # =============================================================================
 
     def draw_robots(self, scaled_field: np.array):
-        for bot in self.blue_robots:
-            if bot.pos.x < INF:
-                b_pos = np.array([bot.pos.x, bot.pos.y])
-                self.draw_bot(b_pos, bot.pos.orientation, BLUE_C, scaled_field,
-                              bot.id)
-
-        for bot in self.yellow_robots:
-            if bot.pos.x < INF:
-                b_pos = np.array([bot.pos.x, bot.pos.y])
-                self.draw_bot(b_pos, bot.pos.orientation, YELLOW_C, scaled_field,
-                              bot.id)
+        for bot_id, x, y, orientation in self.blue_robots:
+            self.draw_bot(np.array([x, y]), orientation, BLUE_C, scaled_field,
+                          int(bot_id))
+
+        for bot_id, x, y, orientation in self.yellow_robots:
+            self.draw_bot(np.array([x, y]), orientation, YELLOW_C, scaled_field,
+                          int(bot_id))
 
     def draw_bot(self, pos: np.array, orientation: float, color,
                  scaled_field: np.array, id: int):
@@ -294,32 +341,58 @@ class DrawSSL(object):
 
             pygame.draw.aalines(self.window, text_c, True, pos_ang)
 
+    def draw_deviations(self, scaled_field: np.array):
+        for x, y, target_x, target_y in self.deviations:
+            if np.hypot(target_x - x, target_y - y) <= DISTANCE_THRESHOLD:
+                continue
+            start = self.scale(np.array([x, y]), scaled_field)
+            end = self.scale(np.array([target_x, target_y]), scaled_field)
+            pygame.draw.line(self.window, 'white', start, end, 2)
+
+            text_pos = (start + end) / 2
+            try:
+                self.font.render_to(self.window, text_pos, '{:.0f} mm'.format(
+                    np.hypot(target_x - x, target_y - y)), 'white')
+            except TypeError:
+                pass
+
 
 # =============================================================================
 
-    def update_robots(self, robots: [Robot], team: str):
+    def update_robots(self, robots: ObjectState):
+        self.send_field_model()
         if self.process.is_alive() and not self.process_queue.full():
-            if team == YELLOW_TEAM:
-                self.yellow_robots = robots
+            if robots.team == YELLOW_TEAM:
+                self.yellow_robots = robots.visible_rows()
                 self.process_queue.put_nowait({'BotYP': self.yellow_robots})
-            elif team == BLUE_TEAM:
-                self.blue_robots = robots
+            elif robots.team == BLUE_TEAM:
+                self.blue_robots = robots.visible_rows()
                 self.process_queue.put_nowait({'BotBP': self.blue_robots})
 
 # =============================================================================
 
-    def update_ball(self, pos: Position):
+    def update_ball(self, ball: ObjectState):
+        self.send_field_model()
         if self.process.is_alive() and not self.process_queue.full():
-            self.ball = np.array([pos.x, pos.y])
+            self.ball = np.array([ball.x[0], ball.y[0]])
             self.process_queue.put_nowait({'BallP': self.ball})
 
 # =============================================================================
 
     def update_challenge_data(self, chl_data: [Challenge_Data]):
+        self.send_field_model()
         if self.process.is_alive() and not self.process_queue.full():
             self.challenge_positions = chl_data
             self.process_queue.put_nowait({'ChallengeP': chl_data})
 
+# =============================================================================
+
+    def update_deviations(self, deviations: np.ndarray):
+        self.send_field_model()
+        if self.process.is_alive() and not self.process_queue.full():
+            self.deviations = deviations
+            self.process_queue.put_nowait({'DeviationP': deviations})
+
 # =============================================================================
 
     def scale(self, pos: np.array, field_sz=None) -> np.array:
@@ -367,5 +440,8 @@ class DrawSSL(object):
 # =============================================================================
 
     def get_ui_event(self) -> str:
-        if self.init_ui and not self.ui_queue.empty():
-            return self.ui_queue.get_nowait()
+        if self.init_ui and self.ui_receiver.poll():
+            return self.ui_receiver.recv()
+
+    def get_ui_fileobj(self):
+        return self.ui_receiver
@@ -1,8 +1,10 @@
+import hashlib
 import socket
 import struct
+import sys
 import pickle
-import time
 import numpy as np
+from tabulate import tabulate
 from google.protobuf.message import DecodeError
 
 from socket import timeout as TimeoutException
@@ -20,7 +22,15 @@ import referee_pb2 as referee
 from ssl_vision_geometry_pb2 import SSL_GeometryData, SSL_GeometryFieldSize, SSL_FieldCircularArc
 
 from aux.utils import red_print, blue_print, green_print, purple_print
-from aux.RobotBall import BLUE_TEAM, YELLOW_TEAM
+from aux import clock
+from aux.field_model import FieldModel
+from aux.referee_state import RefereeState, RefereeEvent, TeamInfo
+from aux.vision_stats import VisionStats
+from aux.detection_array import DetectionArray, BALL_CODE, NO_CAMERA
+from aux.prediction import VelocityEstimator
+from aux.source_arbiter import SourceArbiter, SourceSwitchEvent
+from aux.packet_log import PacketLogWriter, VISION_LOG_ID, AUTOREF_LOG_ID, \
+    REFEREE_LOG_ID
 
 DEBUG = False
 DEFAULT_VISION_PORT = 10006
@@ -31,41 +41,367 @@ DEFAULT_REFEREE_IP = '224.5.23.1'
 
 AUTOREF_TRACKED_PORT = 10010
 
+VISION_SOURCE = 'VISION'
+AUTOREF_SOURCE = 'AUTOREF'
+REFEREE_SOURCE = 'REFEREE'
+
+# Most trusted source of detections first, see aux/source_arbiter.py
+DEFAULT_SOURCE_PRIORITY = [AUTOREF_SOURCE, VISION_SOURCE]
+
+MAX_PACKET_SIZE = 4096  # in bytes
+MAX_PACKETS_PER_TICK = 256  # upper bound when draining a socket
+
+# Source of each datagram in the recorded logs, see aux/packet_log.py
+LOG_SOURCE_IDS = {VISION_SOURCE: VISION_LOG_ID,
+                  AUTOREF_SOURCE: AUTOREF_LOG_ID,
+                  REFEREE_SOURCE: REFEREE_LOG_ID}
+
+# Kernel receive buffer (SO_RCVBUF) per source in bytes, 0 keeps the system
+# default. Linux doubles the requested value and caps it to net.core.rmem_max
+DEFAULT_RCVBUF_SIZES = {VISION_SOURCE: 0,
+                        AUTOREF_SOURCE: 0,
+                        REFEREE_SOURCE: 0}
+
+# Linux only: the kernel attaches its drop counter (uint32) to each datagram
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+RXQ_OVFL_SUPPORTED = sys.platform.startswith('linux') and \
+    hasattr(socket.socket, 'recvmsg_into')
+RXQ_OVFL_CMSG_SIZE = socket.CMSG_SPACE(4) if RXQ_OVFL_SUPPORTED else 0
+
+
+def unwrap_vision_packet(packet: wrapper.SSL_WrapperPacket) -> (detection.SSL_DetectionFrame,
+                                                                geometry.SSL_GeometryData):
+    detection_frame = None
+    geometry_data = None
+    if packet.HasField('detection'):
+        detection_frame = packet.detection
+    if packet.HasField('geometry'):
+        geometry_data = packet.geometry
+    return (detection_frame, geometry_data)
+
+
+def unwrap_tracker_packet(packet: tigers_wrapper.TrackerWrapperPacket) -> (tigers_detection.TrackedFrame,
+                                                                           None):
+    if packet.HasField('tracked_frame'):
+        return (packet.tracked_frame, None)
+    return (None, None)
+
+
+# Each socket carries a single message type, so the decoder is chosen by the
+# source of the packet: (message class, unwrap function)
+PACKET_DECODERS = {VISION_SOURCE: (wrapper.SSL_WrapperPacket, unwrap_vision_packet),
+                   AUTOREF_SOURCE: (tigers_wrapper.TrackerWrapperPacket, unwrap_tracker_packet)}
+
+class GeometryCache(object):
+    """
+    Keeps the field model built from the last geometry, it is only rebuilt
+    when the serialized field geometry changes
+    """
+
+    def __init__(self):
+        self.field_hash = None
+        self.field_model = None
+
+    def update(self, geometry_data: geometry.SSL_GeometryData) -> FieldModel:
+        """
+        Returns the new field model if the geometry changed, None otherwise
+        """
+        field_bytes = geometry_data.field.SerializeToString()
+        field_hash = hashlib.blake2b(field_bytes, digest_size=16).digest()
+        if field_hash == self.field_hash or \
+                geometry_data.field.field_length == 0:
+            return None
+
+        self.field_hash = field_hash
+        self.field_model = FieldModel.from_geometry(geometry_data.field)
+        if DEBUG:
+            blue_print('[UDP] New geometry', self.field_model)
+        return self.field_model
+
+# =============================================================================
+
+
+CAMERA_TIMEOUT = 0.5  # in seconds, of vision time (t_capture)
+MIN_CONFIDENCE = 1e-3  # weight of detections that report no confidence
+
+
+class VisionFusion(object):
+    """
+    Keeps the latest SSL-Vision detections of each camera and merges them into
+    a single world snapshot. Objects seen by more than one camera are
+    averaged, weighted by their detection confidence, and get a velocity
+    estimated from the previous snapshots
+    """
+
+    def __init__(self, camera_timeout=CAMERA_TIMEOUT):
+        self.camera_timeout = camera_timeout
+        self.camera_frames = dict()  # camera id -> DetectionArray
+        self.camera_times = dict()  # camera id -> t_capture
+        self.fused = DetectionArray()
+        self.velocity = VelocityEstimator()
+
+    def add_frame(self, frame: detection.SSL_DetectionFrame,
+                  rx_time=0.0) -> bool:
+        camera_frame = self.camera_frames.get(frame.camera_id)
+        if camera_frame == None:
+            camera_frame = DetectionArray()
+            self.camera_frames[frame.camera_id] = camera_frame
+        elif frame.t_capture < self.camera_times[frame.camera_id]:
+            return False
+
+        camera_frame.fill_from_detection(frame, rx_time)
+        self.camera_times[frame.camera_id] = frame.t_capture
+        return True
+
+    def has_frames(self) -> bool:
+        return len(self.camera_frames) > 0
+
+    def drop_old_cameras(self):
+        if not self.has_frames():
+            return
+
+        t_newest = max(self.camera_times.values())
+        old_cameras = [camera_id for camera_id, t_capture in self.camera_times.items()
+                       if t_newest - t_capture > self.camera_timeout]
+        for camera_id in old_cameras:
+            del self.camera_frames[camera_id]
+            del self.camera_times[camera_id]
+
+# =============================================================================
+
+    def fuse(self) -> np.ndarray:
+        """
+        Returns one row per robot and at most one ball row, the rows are
+        overwritten by the next call
+        """
+        self.drop_old_cameras()
+        self.fused.clear()
+        if not self.has_frames():
+            return self.fused.rows()
+
+        rows = np.concatenate([frame.rows()
+                               for frame in self.camera_frames.values()])
+        weights = np.maximum(rows['confidence'], MIN_CONFIDENCE)
+
+        balls = rows['team'] == BALL_CODE
+        if np.any(balls):
+            ball_weights = weights[balls]
+            ball_sum = np.sum(ball_weights)
+            self.fused.append(BALL_CODE, 0,
+                              np.dot(ball_weights, rows['x'][balls]) / ball_sum,
+                              np.dot(ball_weights, rows['y'][balls]) / ball_sum,
+                              0.0, np.max(rows['confidence'][balls]),
+                              rows['camera'][balls][0] if len(ball_weights) == 1
+                              else NO_CAMERA,
+                              np.max(rows['t_capture'][balls]),
+                              t_local=np.max(rows['t_local'][balls]))
+
+        robots = rows[~balls]
+        if len(robots) == 0:
+            self.velocity.estimate(self.fused.rows())
+            return self.fused.rows()
+
+        weights = weights[~balls]
+        keys = robots['team'].astype(np.int64) * 256 + robots['id']
+        keys, first, group = np.unique(keys, return_index=True,
+                                       return_inverse=True)
+        weight_sum = np.bincount(group, weights)
+
+        def weighted_mean(values):
+            return np.bincount(group, weights * values) / weight_sum
+
+        n_robots = len(keys)
+        start = self.fused.size
+        self.fused.reserve(start + n_robots)
+        fused = self.fused.data[start:start + n_robots]
+        fused['team'] = robots['team'][first]
+        fused['id'] = robots['id'][first]
+        fused['x'] = weighted_mean(robots['x'])
+        fused['y'] = weighted_mean(robots['y'])
+        fused['theta'] = np.arctan2(weighted_mean(np.sin(robots['theta'])),
+                                    weighted_mean(np.cos(robots['theta'])))
+        fused['confidence'] = 0
+        np.maximum.at(fused['confidence'], group, robots['confidence'])
+        fused['t_capture'] = 0
+        np.maximum.at(fused['t_capture'], group, robots['t_capture'])
+        fused['t_local'] = 0
+        np.maximum.at(fused['t_local'], group, robots['t_local'])
+        fused['camera'] = np.where(np.bincount(group) == 1,
+                                   robots['camera'][first], NO_CAMERA)
+        self.fused.size = start + n_robots
+        self.velocity.estimate(self.fused.rows())
+        return self.fused.rows()
+
+# =============================================================================
+
 
 class UDPCommunication(object):
-    def __init__(self, v_port: int, v_group: str, r_port: int, r_group: str, use_autoref: bool):
-        self.UDP_TIMEOUT = 0.0001  # in seconds
-        self.packets_since_autoref = 0
-        self.last_vision_packet = None
+    def __init__(self, v_port: int, v_group: str, r_port: int, r_group: str,
+                 use_autoref: bool, batch_vision=True, rcvbuf_sizes=None):
+        self.use_autoref = use_autoref
+        self.set_source_priority(DEFAULT_SOURCE_PRIORITY)
+
+        # Batched ingest: drain every pending datagram each tick
+        self.batch_vision = batch_vision
+        self.skipped_frames = 0  # stale frames dropped in the last tick
+        self.total_skipped_frames = 0
+        self.vision_fusion = VisionFusion()
+        self.geometry_cache = GeometryCache()
+        self.vision_stats = VisionStats()
+        self.referee_state = None
+        self.referee_stage = None  # raw enum value of the last stage
+
+        if rcvbuf_sizes == None:
+            rcvbuf_sizes = DEFAULT_RCVBUF_SIZES
+        self.rcvbuf_sizes = dict()  # actual SO_RCVBUF reported by the kernel
+        self.drop_accounting = RXQ_OVFL_SUPPORTED
+
+        self.init_buffers()
+
         green_print(f'Use AutoRef Data = {use_autoref}')
+        green_print(f'Batch Vision Data = {batch_vision}')
+
+        self.init_sockets(v_port, v_group, r_port, r_group, rcvbuf_sizes)
 
+    def init_sockets(self, v_port: int, v_group: str, r_port: int,
+                     r_group: str, rcvbuf_sizes: dict):
         self.v_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
                                       socket.IPPROTO_UDP)
-        self.init_socket(self.v_socket, v_group, v_port)
+        self.init_socket(self.v_socket, v_group, v_port, VISION_SOURCE,
+                         rcvbuf_sizes[VISION_SOURCE])
 
-        if use_autoref:
+        if self.use_autoref:
             self.autoref_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
                                                 socket.IPPROTO_UDP)
             self.init_socket(self.autoref_socket, v_group,
-                             AUTOREF_TRACKED_PORT)
+                             AUTOREF_TRACKED_PORT, AUTOREF_SOURCE,
+                             rcvbuf_sizes[AUTOREF_SOURCE])
         else:
             self.autoref_socket = None
 
         self.r_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
                                       socket.IPPROTO_UDP)
-        self.init_socket(self.r_socket, r_group, r_port)
+        self.init_socket(self.r_socket, r_group, r_port, REFEREE_SOURCE,
+                         rcvbuf_sizes[REFEREE_SOURCE])
 
 # =============================================================================
 
-    def init_socket(self, socket_obj: socket, group, port):
+    def init_buffers(self):
+        # Preallocated receive buffers and protobuf messages, reused for every
+        # packet to avoid allocations in the receive path
+        self.buffers = {source: bytearray(MAX_PACKET_SIZE)
+                        for source in (VISION_SOURCE, AUTOREF_SOURCE,
+                                       REFEREE_SOURCE)}
+        self.buffer_views = {source: memoryview(buffer)
+                             for source, buffer in self.buffers.items()}
+        self.vision_messages = {source: decoder[0]()
+                                for source, decoder in PACKET_DECODERS.items()}
+        self.referee_frame = referee.SSL_Referee()
+        # Detections of the last converted frame and of the newest AutoRef frame
+        self.vision_array = DetectionArray()
+        self.autoref_detections = DetectionArray()
+
+        # Datagrams dropped by the kernel (SO_RXQ_OVFL) and truncated on
+        # receive, per source
+        self.kernel_drops = {source: 0 for source in self.buffers}
+        self.truncated_packets = {source: 0 for source in self.buffers}
+
+        self.recorder = None  # PacketLogWriter while recording
+        # aux.clock.monotonic() when the last packet returned by each
+        # get_*_packet was received, set by every backend
+        self.rx_times = {source: 0.0 for source in self.buffers}
+
+    def init_socket(self, socket_obj: socket, group, port, source: str,
+                    rcvbuf=0):
         socket_obj.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if rcvbuf > 0:
+            socket_obj.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.rcvbuf_sizes[source] = socket_obj.getsockopt(socket.SOL_SOCKET,
+                                                          socket.SO_RCVBUF)
+        # Linux reports twice the requested size (bookkeeping overhead)
+        requested = 2 * rcvbuf if sys.platform.startswith('linux') else rcvbuf
+        if self.rcvbuf_sizes[source] < requested:
+            red_print(f'[UDP] {source} SO_RCVBUF capped to',
+                      f'{self.rcvbuf_sizes[source]} bytes,',
+                      'increase net.core.rmem_max')
+
+        if self.drop_accounting:
+            try:
+                socket_obj.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            except OSError as except_type:
+                red_print('[UDP] Kernel drop accounting disabled:',
+                          except_type)
+                self.drop_accounting = False
+
         socket_obj.bind((group, port))
         green_print(f'Connecting to {group}:{port}...')
 
         mreq = struct.pack('4sl', socket.inet_aton(group), socket.INADDR_ANY)
         socket_obj.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
                               mreq)
-        socket_obj.settimeout(self.UDP_TIMEOUT)
+        # Reads only happen once the socket is readable, see get_selectables
+        socket_obj.setblocking(False)
+
+    def get_selectables(self) -> [(str, socket.socket)]:
+        selectables = [(VISION_SOURCE, self.v_socket),
+                       (REFEREE_SOURCE, self.r_socket)]
+        if self.autoref_socket != None:
+            selectables.append((AUTOREF_SOURCE, self.autoref_socket))
+        return selectables
+
+    def ready_sources(self, ready: [str]) -> [str]:
+        """
+        Maps the sources returned by the selector to the sources with data
+        """
+        return ready
+
+    def next_packet_timeout(self) -> float:
+        """
+        Seconds until a source has data without being selectable (replays),
+        None when the selector is enough
+        """
+        return None
+
+    def is_finished(self) -> bool:
+        return False
+
+    def start_recording(self, filename: str):
+        """
+        Saves every received datagram to filename, see aux/packet_log.py
+        """
+        self.stop_recording()
+        self.recorder = PacketLogWriter(filename)
+
+    def stop_recording(self):
+        if self.recorder != None:
+            recorder = self.recorder
+            self.recorder = None
+            recorder.close()
+
+    def record_packet(self, source: str, packet, rx_monotonic: float):
+        recorder = self.recorder
+        if recorder != None:
+            recorder.write(LOG_SOURCE_IDS[source], rx_monotonic, packet)
+
+    def get_socket_stats(self) -> dict:
+        return {source: {'rcvbuf': rcvbuf,
+                         'kernel_drops': self.kernel_drops[source] if self.drop_accounting else None,
+                         'truncated': self.truncated_packets[source]}
+                for source, rcvbuf in self.rcvbuf_sizes.items()}
+
+    def print_stats(self):
+        blue_print(f'[UDP] Stale vision frames skipped = {self.total_skipped_frames}')
+        self.vision_stats.print_stats()
+
+        header = ['Source', 'SO_RCVBUF [bytes]', 'Kernel Drops', 'Truncated']
+        data = [[source, stats['rcvbuf'],
+                 stats['kernel_drops'] if stats['kernel_drops'] != None else '-',
+                 stats['truncated']]
+                for source, stats in self.get_socket_stats().items()]
+        blue_print(tabulate(data, header), '\n')
+
+        if self.recorder != None:
+            self.recorder.print_stats()
 
 # =============================================================================
 
@@ -78,46 +414,33 @@ class UDPCommunication(object):
 
 # =============================================================================
 
-    def process_vision_packet(self, packet) -> (bool, detection.SSL_DetectionFrame,
-                                                geometry.SSL_GeometryData):
-        if packet == None:
+    def process_vision_packet(self, packet, source=VISION_SOURCE) -> (bool, detection.SSL_DetectionFrame,
+                                                                     geometry.SSL_GeometryData):
+        """
+        The returned frames belong to messages that are reused for the next
+        packet of the same source, convert them (detection_frame_to_array)
+        before processing the next packet
+        """
+        if packet == None or len(packet) == 0:
             return (False, None, None)
 
-        data_ok = False
-        wrapper_frame = wrapper.SSL_WrapperPacket()
-        tigers_detection_frame = tigers_detection.TrackedFrame()
-        tigers_wrapper_frame = tigers_wrapper.TrackerWrapperPacket()
-        geometry_data = geometry.SSL_GeometryData()
-
-        if len(packet) > 0:
-            try:
-                wrapper_frame.ParseFromString(packet)
-                pkt_fields = wrapper_frame.ListFields()
+        message = self.vision_messages[source]
+        unwrap_packet = PACKET_DECODERS[source][1]
 
-                for field in pkt_fields:
-                    if field[0].name == 'geometry':
-                        geometry_data = wrapper_frame.geometry
-
-                data_ok = True
-                return (data_ok, wrapper_frame.detection, geometry_data)
-
-            except DecodeError as except_type:
-                tigers_wrapper_frame.ParseFromString(packet)
-                tigers_detection_frame = tigers_wrapper_frame.tracked_frame
-
-                data_ok = True
-                return (data_ok, tigers_detection_frame, None)
-
-            except Exception as except_type:
-                red_print(except_type, type(except_type))
+        try:
+            message.ParseFromString(packet)
+        except DecodeError as except_type:
+            red_print(f'[UDP] Invalid {source} packet:', except_type)
+            return (False, None, None)
 
-        return (data_ok, detection.SSL_DetectionFrame(), geometry.SSL_GeometryData())
+        detection_frame, geometry_data = unwrap_packet(message)
+        return (True, detection_frame, geometry_data)
 
 # =============================================================================
 
     def process_referee_packet(self, packet) -> (bool, referee.SSL_Referee):
         data_ok = False
-        referee_frame = referee.SSL_Referee()
+        referee_frame = self.referee_frame
 
         if len(packet) > 0:
             try:
@@ -128,112 +451,223 @@ class UDPCommunication(object):
             except Exception as except_type:
                 red_print(except_type)
 
-        return (data_ok, referee.SSL_Referee())
+        return (data_ok, None)
 
 # =============================================================================
 
-    def detection_frame_to_dict(self, detection_frame: detection.SSL_DetectionFrame) -> dict:
-        frame_dict = dict()
+    def referee_packet_to_state(self, referee_frame: referee.SSL_Referee) -> RefereeState:
+        def to_team_info(team: referee.SSL_Referee.TeamInfo) -> TeamInfo:
+            return TeamInfo(team.name, team.score, team.red_cards,
+                            team.yellow_cards, team.timeouts,
+                            team.timeout_time, team.goalie)
+
+        designated_position = None
+        if referee_frame.HasField('designated_position'):
+            designated_position = [referee_frame.designated_position.x,
+                                   referee_frame.designated_position.y]
+
+        state = RefereeState(referee_frame.Stage.Name(referee_frame.stage),
+                             referee_frame.Command.Name(referee_frame.command),
+                             referee_frame.command_counter,
+                             referee_frame.command_timestamp,
+                             referee_frame.packet_timestamp,
+                             referee_frame.stage_time_left,
+                             designated_position,
+                             to_team_info(referee_frame.yellow),
+                             to_team_info(referee_frame.blue))
+        return state
 
-        if not isinstance(detection_frame, detection.SSL_DetectionFrame) and \
-                not isinstance(detection_frame, tigers_detection.TrackedFrame):
-            return frame_dict
+# =============================================================================
 
+    def detection_frame_to_array(self, detection_frame) -> np.ndarray:
+        """
+        Fills the preallocated detection array (see aux/detection_array.py)
+        with a SSL_DetectionFrame or TrackedFrame, the rows are overwritten by
+        the next call
+        """
         if isinstance(detection_frame, detection.SSL_DetectionFrame):
-            ball_pos = [[round(ball.x), round(ball.y), 0]
-                        for ball in detection_frame.balls]
-
-            # Use the mean in case there is more than one ball
-            if len(ball_pos) > 0:
-                if len(ball_pos) > 1 and DEBUG:
-                    red_print('WARNING! More than one ball detected')
-                mean_pos = np.mean(np.array(ball_pos), axis=0)
-                ball_pos = mean_pos.tolist()
-
-            ball = {'pos': ball_pos}
-
-            blue_robots = [{'obj': {'pos': [round(robot.x), round(robot.y), robot.orientation]},
-                            'id': {'number': robot.robot_id, 'color': BLUE_TEAM}}
-                           for robot in detection_frame.robots_blue]
-
-            yellow_robots = [{'obj': {'pos': [round(robot.x), round(robot.y), robot.orientation]},
-                              'id': {'number': robot.robot_id, 'color': YELLOW_TEAM}}
-                             for robot in detection_frame.robots_yellow]
+            return self.vision_array.fill_from_detection(detection_frame)
         elif isinstance(detection_frame, tigers_detection.TrackedFrame):
-            ball_pos = [[round(ball.pos.x*1000), round(ball.pos.y*1000), 0]
-                        for ball in detection_frame.balls]
-
-            # Use the mean in case there is more than one ball
-            if len(ball_pos) > 0:
-                if len(ball_pos) > 1 and DEBUG:
-                    red_print('WARNING! More than one ball detected')
-                mean_pos = np.mean(np.array(ball_pos), axis=0)
-                ball_pos = mean_pos.tolist()
-
-            ball = {'pos': ball_pos}
-
-            def conv_team(t_id): return BLUE_TEAM if t_id == 2 else YELLOW_TEAM
-
-            blue_robots = [{'obj': {'pos': [round(robot.pos.x*1000), round(robot.pos.y*1000), robot.orientation]},
-                            'id': {'number': robot.robot_id.id, 'color': conv_team(robot.robot_id.team)}}
-                           for robot in detection_frame.robots]
-            yellow_robots = []
-
-        frame_dict['ball'] = ball
-        frame_dict['bots'] = blue_robots
-        frame_dict['bots'].extend(yellow_robots)
-
-        return frame_dict
-
-    def geometry_frame_to_dict(self, geometry_frame: geometry.SSL_GeometryData) -> dict():
-        frame_dict = dict()
+            return self.vision_array.fill_from_tracked(detection_frame)
+        return None
 
-        if not isinstance(geometry_frame, geometry.SSL_GeometryData):
-            return frame_dict
+# =============================================================================
 
-        if geometry_frame.field.field_length != 0:
-            frame_dict['field_size'] = [geometry_frame.field.field_length,
-                                        geometry_frame.field.field_width]
-            for arc in geometry_frame.field.field_arcs:
-                if arc.name == 'CenterCircle':
-                    frame_dict['center_circle'] = arc.radius
-            return frame_dict
+    def set_source_priority(self, priority: [str], staleness=None):
+        """
+        Sources of detections from the most to the least trusted, a source is
+        used while its last frame is newer than its staleness (in seconds)
+        """
+        if not self.use_autoref:
+            priority = [source for source in priority
+                        if source != AUTOREF_SOURCE]
+        self.source_arbiter = SourceArbiter(priority, staleness,
+                                            self.frame_time)
+
+    def frame_time(self) -> float:
+        """
+        Monotonic time used for the staleness deadlines of the sources, it
+        follows the log during a replay
+        """
+        return clock.monotonic()
+
+    def get_source_events(self) -> [SourceSwitchEvent]:
+        return self.source_arbiter.pop_events()
+
+    def select_vision_data(self, new_vision: bool, new_autoref: bool) -> np.ndarray:
+        """
+        Detections of the source chosen by the arbiter, None if that source
+        has no new frame
+        """
+        source = self.source_arbiter.select()
+        if source == AUTOREF_SOURCE and new_autoref:
+            return self.autoref_detections.rows()
+        if source == VISION_SOURCE and new_vision:
+            return self.vision_fusion.fuse()
         return None
 
 # =============================================================================
 
-    def get_vision_socket_data(self) -> (dict, dict):
+    def get_vision_socket_data(self) -> (np.ndarray, FieldModel):
+        """
+        Returns the detections (rows of aux.detection_array.DETECTION_DTYPE,
+        valid until the next call) and the field model, the field model is
+        only returned when the geometry changed
+        """
+        if self.batch_vision:
+            return self.get_batched_vision_data()
+
         vision_packet = self.get_vision_packet()
-        if self.autoref_socket != None:
+        if self.use_autoref:
             autoref_packet = self.get_autoref_vision_packet()
         else:
             autoref_packet = None
 
         vis_ok, det_data, geo_data = self.process_vision_packet(vision_packet)
-        ar_ok, ar_det_data, _ = self.process_vision_packet(autoref_packet)
-
-        if ar_ok:
-            self.packets_since_autoref = 0
-            det_data = ar_det_data
-            self.last_vision_packet = det_data
-        elif self.packets_since_autoref < 1000:
-            det_data = self.last_vision_packet
-        else:
-            self.last_vision_packet = det_data
+        if det_data != None:
+            self.add_frame_stats(det_data)
+        if geo_data != None:
+            geo_data = self.geometry_cache.update(geo_data)
+        ar_ok, ar_det_data, _ = self.process_vision_packet(autoref_packet,
+                                                           AUTOREF_SOURCE)
+
+        new_autoref = ar_ok and ar_det_data != None
+        if new_autoref:
+            self.autoref_detections.fill_from_tracked(
+                ar_det_data, self.rx_times[AUTOREF_SOURCE])
+            self.source_arbiter.frame_received(AUTOREF_SOURCE)
+        new_vision = det_data != None and \
+            self.vision_fusion.add_frame(det_data, self.rx_times[VISION_SOURCE])
+        if new_vision:
+            self.source_arbiter.frame_received(VISION_SOURCE)
+        vision_data = self.select_vision_data(new_vision, new_autoref)
 
         if vis_ok or ar_ok:
-            return (self.detection_frame_to_dict(det_data),
-                    self.geometry_frame_to_dict(geo_data))
+            return (vision_data, geo_data)
 #          else:
 #              red_print('[UDP] Failed to process vision packet!', '\r')
         return (None, None)
 
+    def get_batched_vision_data(self) -> (np.ndarray, FieldModel):
+        """
+        Empties the vision (and autoref) sockets, keeping only the newest
+        frame of each camera. The frames that were overwritten by a newer one
+        are counted in `skipped_frames`
+        """
+        n_frames = 0
+        updated_cameras = set()
+        geo_data = None
+
+        for packet in self.iter_packets(self.get_vision_packet):
+            vis_ok, det_data, packet_geo = self.process_vision_packet(packet)
+            if not vis_ok:
+                continue
+
+            if packet_geo != None:
+                field_model = self.geometry_cache.update(packet_geo)
+                if field_model != None:
+                    geo_data = field_model
+
+            if det_data != None:
+                self.add_frame_stats(det_data)
+                n_frames += 1
+                if self.vision_fusion.add_frame(det_data,
+                                                self.rx_times[VISION_SOURCE]):
+                    updated_cameras.add(det_data.camera_id)
+
+        n_ar_frames = 0
+        if self.use_autoref:
+            for packet in self.iter_packets(self.get_autoref_vision_packet):
+                ar_ok, det_data, _ = self.process_vision_packet(packet,
+                                                                AUTOREF_SOURCE)
+                if ar_ok and det_data != None:
+                    n_ar_frames += 1
+                    self.autoref_detections.fill_from_tracked(
+                        det_data, self.rx_times[AUTOREF_SOURCE])
+
+        self.skipped_frames = n_frames - len(updated_cameras) + \
+            max(n_ar_frames - 1, 0)
+        self.total_skipped_frames += self.skipped_frames
+
+        if n_ar_frames > 0:
+            self.source_arbiter.frame_received(AUTOREF_SOURCE)
+        if len(updated_cameras) > 0:
+            self.source_arbiter.frame_received(VISION_SOURCE)
+        vision_data = self.select_vision_data(len(updated_cameras) > 0,
+                                              n_ar_frames > 0)
+
+        return (vision_data, geo_data)
+
+    def add_frame_stats(self, det_data):
+        """
+        The latencies are measured from the moment the packet was received,
+        not from when it is decoded
+        """
+        rx_monotonic = self.rx_times[VISION_SOURCE]
+        rx_time = clock.now() - (clock.monotonic() - rx_monotonic)
+        self.vision_stats.add_frame(det_data, rx_time, rx_monotonic)
+
+    def iter_packets(self, read_packet):
+        """
+        Yields the pending packets one at a time, each packet must be processed
+        before reading the next one since the receive buffer is reused
+        """
+        for _ in range(MAX_PACKETS_PER_TICK):
+            packet = read_packet()
+            if packet == None:
+                return
+            yield packet
+
+    def receive_packet(self, socket_obj: socket.socket, source: str) -> memoryview:
+        if RXQ_OVFL_SUPPORTED:
+            n_bytes, ancdata, flags, _ = socket_obj.recvmsg_into(
+                [self.buffers[source]], RXQ_OVFL_CMSG_SIZE)
+            self.check_receive(source, ancdata, flags)
+        else:
+            n_bytes = socket_obj.recv_into(self.buffers[source])
+
+        packet = self.buffer_views[source][:n_bytes]
+        self.rx_times[source] = clock.monotonic()
+        if self.recorder != None:
+            self.record_packet(source, packet, self.rx_times[source])
+        return packet
+
+    def check_receive(self, source: str, ancdata: list, flags: int):
+        """
+        Updates the drop counters with the ancillary data of one recvmsg
+        """
+        # The kernel only attaches the counter once something was dropped
+        for level, cmsg_type, data in ancdata:
+            if level == socket.SOL_SOCKET and cmsg_type == SO_RXQ_OVFL:
+                self.kernel_drops[source] = struct.unpack('=I', data[:4])[0]
+        if flags & socket.MSG_TRUNC:
+            self.truncated_packets[source] += 1
+
     def get_vision_packet(self):
         try:
-            packet = self.v_socket.recv(4096)
+            packet = self.receive_packet(self.v_socket, VISION_SOURCE)
             return packet
-        except TimeoutException:
-            self.packets_since_autoref += 1
+        except (TimeoutException, BlockingIOError):
             return None
         except Exception as except_type:
             red_print('[UDP]', except_type)
@@ -241,9 +675,9 @@ class UDPCommunication(object):
 
     def get_autoref_vision_packet(self):
         try:
-            packet = self.autoref_socket.recv(4096)
+            packet = self.receive_packet(self.autoref_socket, AUTOREF_SOURCE)
             return packet
-        except TimeoutException:
+        except (TimeoutException, BlockingIOError):
             return None
         except Exception as except_type:
             red_print('[UDP]', except_type)
@@ -251,30 +685,45 @@ class UDPCommunication(object):
 
 # =============================================================================
 
-    def get_referee_socket_data(self) -> dict:
-        packet = b''
-        ok = False
-        ret_val = None
-        try:
-            packet = self.r_socket.recv(4096)
-            ok = True
-        except TimeoutException:
+    def get_referee_socket_data(self) -> [RefereeEvent]:
+        """
+        Processes every pending referee packet, so a command that only lasts
+        a few packets isn't missed. Returns the events of the packets where
+        the referee command or stage changed
+        """
+        events = []
+        packet = self.get_referee_packet()
+        while packet != None:
+            event = self.referee_packet_event(packet)
+            if event != None:
+                events.append(event)
+            packet = self.get_referee_packet()
+        return events
+
+    def referee_packet_event(self, packet) -> RefereeEvent:
+        ok, ref_data = self.process_referee_packet(packet)
+        if not ok:
+            red_print('[UDP] Failed to process referee packet!', '\r')
             return None
 
-        except Exception as except_type:
-            red_print('[UDP]', except_type)
+        last_state = self.referee_state
+        if last_state != None and \
+                ref_data.command_counter == last_state.command_counter and \
+                ref_data.stage == self.referee_stage:
+            return None
 
-        if ok:
-            ok, ref_data = self.process_referee_packet(packet)
-            if ok:
-                ret_val = {'Command': ref_data.Command.Name(ref_data.command)}
+        self.referee_stage = ref_data.stage
+        self.referee_state = self.referee_packet_to_state(ref_data)
+        return RefereeEvent(self.referee_state, last_state)
 
-            else:
-                red_print('[UDP] Failed to process referee packet!', '\r')
-                ret_val = None
-        else:
-            red_print('[UDP] Failed to receive referee packet!', '\r')
-            ret_val = None
-        return ret_val
+    def get_referee_packet(self):
+        try:
+            packet = self.receive_packet(self.r_socket, REFEREE_SOURCE)
+            return packet
+        except (TimeoutException, BlockingIOError):
+            return None
+        except Exception as except_type:
+            red_print('[UDP] Failed to receive referee packet!', except_type)
+        return None
 
 # =============================================================================
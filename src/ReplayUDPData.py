@@ -0,0 +1,148 @@
+import time
+from collections import deque
+
+from ProcessUDPData import UDPCommunication, VISION_SOURCE, AUTOREF_SOURCE, \
+    REFEREE_SOURCE, LOG_SOURCE_IDS
+
+from aux import clock
+from aux.packet_log import open_log
+from aux.utils import red_print, blue_print, green_print, purple_print
+
+AS_FAST_AS_POSSIBLE = 0
+
+
+class ReplayUDPCommunication(UDPCommunication):
+    """
+    Feeds a recorded datagram log (--record or the standard SSL log format) to
+    the same processing as the live sockets, at 1x, Nx or as fast as possible
+    (speed = 0). While replaying, aux.clock follows the time of the log
+    """
+
+    def __init__(self, filename: str, speed=1.0, start=0.0, use_autoref=False,
+                 batch_vision=True):
+        self.reader = open_log(filename)
+        self.speed = speed
+        self.log_sources = {log_id: source
+                            for source, log_id in LOG_SOURCE_IDS.items()}
+        self.packets = {source: deque() for source in LOG_SOURCE_IDS}
+        self.replayed = 0
+
+        super().__init__(0, '', 0, '', use_autoref, batch_vision)
+        green_print('[REPLAY] {}: {:.1f} s, speed = {}'.format(
+            filename, self.reader.get_duration(),
+            speed if speed != AS_FAST_AS_POSSIBLE else 'as fast as possible'))
+
+        self.seek(start)
+        clock.set_time_source(self.get_time)
+
+    def init_sockets(self, v_port: int, v_group: str, r_port: int,
+                     r_group: str, rcvbuf_sizes: dict):
+        self.v_socket = None
+        self.autoref_socket = None
+        self.r_socket = None
+
+# =============================================================================
+
+    def seek(self, t: float):
+        """
+        Continues the replay t seconds after the start of the log
+        """
+        t_seek = self.reader.start_time + t
+        self.records = self.reader.records(self.reader.find_offset(t))
+        self.next_record = next(self.records, None)
+        # The index has a resolution of one second
+        while self.next_record != None and self.next_record[1] < t_seek:
+            self.next_record = next(self.records, None)
+
+        for packets in self.packets.values():
+            packets.clear()
+
+        self.log_time = self.next_record[1] if self.next_record != None else \
+            self.reader.end_time
+        self.anchor = (time.monotonic(), self.log_time)
+
+    def get_time(self) -> float:
+        """
+        Time of the log being replayed, in seconds
+        """
+        if self.speed == AS_FAST_AS_POSSIBLE or self.next_record == None:
+            return self.log_time
+        real_start, log_start = self.anchor
+        return log_start + (time.monotonic() - real_start) * self.speed
+
+    def is_finished(self) -> bool:
+        return self.next_record == None and \
+            not any(len(packets) > 0 for packets in self.packets.values())
+
+    def next_packet_timeout(self) -> float:
+        if any(len(packets) > 0 for packets in self.packets.values()):
+            return 0
+        if self.next_record == None:
+            return None
+        if self.speed == AS_FAST_AS_POSSIBLE:
+            return 0
+        return max((self.next_record[1] - self.get_time()) / self.speed, 0)
+
+# =============================================================================
+
+    def release_next(self) -> str:
+        source_id, rx_time, packet = self.next_record
+        self.next_record = next(self.records, None)
+        self.log_time = rx_time
+        self.replayed += 1
+
+        source = self.log_sources.get(source_id)
+        if source == None or (source == AUTOREF_SOURCE and not self.use_autoref):
+            return None
+        # The receive time is the one of the recording
+        self.packets[source].append((packet, rx_time))
+        return source
+
+    def release_packets(self):
+        if self.speed == AS_FAST_AS_POSSIBLE:
+            # One vision frame per iteration, like a single camera
+            while self.next_record != None:
+                source = self.release_next()
+                if source == VISION_SOURCE or source == AUTOREF_SOURCE:
+                    break
+        else:
+            now = self.get_time()
+            while self.next_record != None and self.next_record[1] <= now:
+                self.release_next()
+
+        if self.next_record == None:
+            blue_print(f'[REPLAY] End of the log, {self.replayed} packets replayed')
+
+    def get_selectables(self) -> list:
+        return []
+
+    def ready_sources(self, ready: [str]) -> [str]:
+        if self.next_record != None:
+            self.release_packets()
+        return ready + [source for source, packets in self.packets.items()
+                        if len(packets) > 0]
+
+# =============================================================================
+
+    def get_vision_packet(self):
+        return self.pop_packet(VISION_SOURCE)
+
+    def get_autoref_vision_packet(self):
+        return self.pop_packet(AUTOREF_SOURCE)
+
+    def get_referee_packet(self):
+        return self.pop_packet(REFEREE_SOURCE)
+
+    def pop_packet(self, source: str):
+        if len(self.packets[source]) > 0:
+            packet, self.rx_times[source] = self.packets[source].popleft()
+            return packet
+        return None
+
+# =============================================================================
+
+    def print_stats(self):
+        super().print_stats()
+        blue_print('[REPLAY] Replayed = {}, Log time = {:.2f}/{:.2f} s'.format(
+            self.replayed, self.log_time - self.reader.start_time,
+            self.reader.get_duration()))
@@ -0,0 +1,158 @@
+import socket
+import selectors
+import time
+from threading import Thread
+from tabulate import tabulate
+
+from ProcessUDPData import UDPCommunication, VISION_SOURCE, AUTOREF_SOURCE, \
+    REFEREE_SOURCE, MAX_PACKET_SIZE, RXQ_OVFL_SUPPORTED, RXQ_OVFL_CMSG_SIZE
+
+from aux.ring_buffer import RingBuffer
+from aux.utils import red_print, blue_print, green_print, purple_print
+
+DATA_READY_SOURCE = 'DATA_READY'
+RECEIVER_TIMEOUT = 0.5  # in seconds, how often the thread checks for stop
+
+DEFAULT_RING_SIZES = {VISION_SOURCE: 128,
+                      AUTOREF_SOURCE: 16,
+                      REFEREE_SOURCE: 16}
+
+
+class ThreadedUDPCommunication(UDPCommunication):
+    """
+    Reads the sockets in a dedicated receiver thread into a ring buffer per
+    source, so a stall in the logic thread doesn't stop packet reception
+    """
+
+    def __init__(self, v_port: int, v_group: str, r_port: int, r_group: str,
+                 use_autoref: bool, batch_vision=True, rcvbuf_sizes=None,
+                 ring_sizes=None):
+        super().__init__(v_port, v_group, r_port, r_group, use_autoref,
+                         batch_vision, rcvbuf_sizes)
+        if ring_sizes == None:
+            ring_sizes = DEFAULT_RING_SIZES
+
+        self.rings = {source: RingBuffer(ring_sizes[source])
+                      for source, _ in super().get_selectables()}
+
+        # Used to wake up the logic thread when new data arrives
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.wakeup_sender.setblocking(False)
+
+        self.receiving = False
+        self.receiver_thread = None
+
+# =============================================================================
+
+    def start(self):
+        self.receiving = True
+        self.receiver_thread = Thread(target=self.receive_loop, daemon=True)
+        self.receiver_thread.start()
+        green_print('[UDP] Receiver thread started!')
+
+    def stop(self):
+        self.receiving = False
+        if self.receiver_thread != None:
+            self.receiver_thread.join()
+            self.receiver_thread = None
+
+    def receive_loop(self):
+        selector = selectors.DefaultSelector()
+        for source, socket_obj in super().get_selectables():
+            selector.register(socket_obj, selectors.EVENT_READ, source)
+
+        while self.receiving:
+            received = False
+            for key, _ in selector.select(RECEIVER_TIMEOUT):
+                received |= self.receive_all(key.fileobj, key.data)
+
+            if received:
+                try:
+                    self.wakeup_sender.send(b'\0')
+                except BlockingIOError:
+                    # The logic thread already has a pending wake up
+                    pass
+        selector.close()
+
+    def receive_all(self, socket_obj: socket.socket, source: str) -> bool:
+        ring = self.rings[source]
+        received = False
+        while True:
+            try:
+                if RXQ_OVFL_SUPPORTED:
+                    packet, ancdata, flags, _ = socket_obj.recvmsg(
+                        MAX_PACKET_SIZE, RXQ_OVFL_CMSG_SIZE)
+                    self.check_receive(source, ancdata, flags)
+                else:
+                    packet = socket_obj.recv(MAX_PACKET_SIZE)
+            except BlockingIOError:
+                break
+            except Exception as except_type:
+                red_print('[UDP]', except_type)
+                break
+            rx_time = time.monotonic()
+            ring.push(packet, rx_time)
+            self.record_packet(source, packet, rx_time)
+            received = True
+        return received
+
+# =============================================================================
+
+    def get_selectables(self) -> [(str, socket.socket)]:
+        return [(DATA_READY_SOURCE, self.wakeup_receiver)]
+
+    def ready_sources(self, ready: [str]) -> [str]:
+        if DATA_READY_SOURCE in ready:
+            ready.remove(DATA_READY_SOURCE)
+            try:
+                while self.wakeup_receiver.recv(MAX_PACKET_SIZE):
+                    pass
+            except BlockingIOError:
+                pass
+
+        return ready + [source for source, ring in self.rings.items()
+                        if ring.has_data()]
+
+# =============================================================================
+
+    def get_vision_packet(self):
+        if self.batch_vision:
+            return self.pop_packet(VISION_SOURCE)
+
+        # Without batching only one frame is read per iteration, it must be
+        # the newest one
+        ring = self.rings[VISION_SOURCE]
+        skipped = ring.skipped
+        packet = self.pop_packet(VISION_SOURCE, latest=True)
+        self.skipped_frames = ring.skipped - skipped
+        self.total_skipped_frames += self.skipped_frames
+        return packet
+
+    def get_autoref_vision_packet(self):
+        return self.pop_packet(AUTOREF_SOURCE)
+
+    def get_referee_packet(self):
+        # Every referee packet is processed, a command can last a single one
+        return self.pop_packet(REFEREE_SOURCE)
+
+    def pop_packet(self, source: str, latest=False):
+        ring = self.rings[source]
+        packet = ring.pop_latest() if latest else ring.pop()
+        if packet != None:
+            self.rx_times[source] = ring.last_rx_time
+        return packet
+
+# =============================================================================
+
+    def print_stats(self):
+        super().print_stats()
+        header = ['Source', 'Received', 'Consumed', 'Pending', 'Overruns',
+                  'Skipped', 'Lag [ms]', 'Max Lag [ms]']
+        data = []
+        for source, ring in self.rings.items():
+            stats = ring.get_stats()
+            data.append([source, stats['received'], stats['consumed'],
+                         stats['pending'], stats['overruns'], stats['skipped'],
+                         stats['last_lag_ms'], stats['max_lag_ms']])
+        blue_print(tabulate(data, header, floatfmt='.2f'), '\n')
@@ -0,0 +1,459 @@
+#!/usr/bin/python3.8
+"""
+Publishes synthetic SSL-Vision (SSL_WrapperPacket), AutoRef tracker
+(TrackerWrapperPacket) and referee (SSL_Referee) traffic, so
+ChallengeManager.py can be run and load tested without a field
+"""
+import json
+import argparse
+import socket
+import time
+import numpy as np
+from math import ceil
+from os.path import isfile
+
+import ssl_wrapper_pb2 as wrapper
+import ssl_vision_wrapper_tracked_pb2 as tigers_wrapper
+import referee_pb2 as referee
+
+from ProcessUDPData import DEFAULT_VISION_PORT, DEFAULT_VISION_IP, \
+    DEFAULT_REFEREE_PORT, DEFAULT_REFEREE_IP, AUTOREF_TRACKED_PORT
+
+from aux.RobotBall import BLUE_TEAM, YELLOW_TEAM
+from aux.utils import red_print, blue_print, green_print, purple_print
+
+DEFAULT_FIELD_SIZE = [12000, 9000]  # [mm]
+CAMERA_OVERLAP = 300  # [mm] seen by the neighbour cameras too
+GEOMETRY_PERIOD = 1.0  # [s]
+TRACKER_TEAMS = {YELLOW_TEAM: 1, BLUE_TEAM: 2}  # ssl_gc_common Team
+
+
+class SyntheticObject(object):
+    """
+    Robot or ball that follows a list of [t, x, y, theta] waypoints (t in
+    seconds since the start), linearly interpolated
+    """
+
+    def __init__(self, pos: [float, float, float], team=None, robot_id=None):
+        self.team = team
+        self.robot_id = robot_id
+        self.set_waypoints([[0] + list(pos)])
+
+    def set_waypoints(self, waypoints: [[float]]):
+        waypoints = np.array([list(waypoint) + [0.0] * (4 - len(waypoint))
+                              for waypoint in waypoints], dtype=float)
+        # Before the first waypoint the object waits at its current position
+        if waypoints[0, 0] > 0 and hasattr(self, 'waypoints'):
+            start = self.get_pos(0)
+            waypoints = np.vstack([[0] + list(start), waypoints])
+        self.waypoints = waypoints
+
+    def get_pos(self, t: float) -> [float, float, float]:
+        times = self.waypoints[:, 0]
+        return [float(np.interp(t, times, self.waypoints[:, axis]))
+                for axis in (1, 2, 3)]
+
+# =============================================================================
+
+
+class SyntheticWorld(object):
+    def __init__(self, field_size=DEFAULT_FIELD_SIZE, n_robots=6):
+        self.field_size = field_size
+        self.ball = SyntheticObject([0, 0, 0])
+        self.robots = []
+        self.referee_commands = [[0, 'HALT']]
+
+        # Each team on its own half, in a line
+        for team, side in ((BLUE_TEAM, -1), (YELLOW_TEAM, 1)):
+            for robot_id in range(n_robots):
+                pos = [side * field_size[0] / 4,
+                       (robot_id - (n_robots - 1) / 2) * 400, 0]
+                self.robots.append(SyntheticObject(pos, team, robot_id))
+
+    def load_challenge(self, filename: str):
+        """
+        Places the objects as in a ChallengeManager json file
+        """
+        with open(filename, 'r') as challenge_file:
+            data = json.load(challenge_file)
+
+        self.robots = [SyntheticObject(bot['obj']['pos'], bot['id']['color'],
+                                       bot['id']['number'])
+                       for bot in data.get('bots', [])]
+        if 'ball' in data:
+            self.ball = SyntheticObject(data['ball']['pos'])
+
+    def load_script(self, filename: str):
+        """
+        {"motions": [{"id": {"number": 0, "color": "BLUE"},
+                      "waypoints": [[t, x, y, theta], ...]},
+                     {"ball": true, "waypoints": [[t, x, y], ...]}],
+         "referee": [[t, "COMMAND"], ...]}
+        """
+        with open(filename, 'r') as script_file:
+            data = json.load(script_file)
+
+        for motion in data.get('motions', []):
+            if motion.get('ball', False):
+                self.ball.set_waypoints(motion['waypoints'])
+                continue
+
+            robot = self.get_robot(motion['id']['color'],
+                                   motion['id']['number'])
+            if robot == None:
+                robot = SyntheticObject(motion['waypoints'][0][1:],
+                                        motion['id']['color'],
+                                        motion['id']['number'])
+                self.robots.append(robot)
+            robot.set_waypoints(motion['waypoints'])
+
+        if 'referee' in data:
+            self.referee_commands = sorted(data['referee'])
+
+    def get_robot(self, team: str, robot_id: int) -> SyntheticObject:
+        for robot in self.robots:
+            if robot.team == team and robot.robot_id == robot_id:
+                return robot
+        return None
+
+    def get_referee_command(self, t: float) -> (int, str):
+        """
+        Returns the index (used as command counter) and the command at t
+        """
+        current = 0
+        for n, (t_command, _) in enumerate(self.referee_commands):
+            if t_command <= t:
+                current = n
+        return current, self.referee_commands[current][1]
+
+# =============================================================================
+
+
+class TrafficGenerator(object):
+    def __init__(self, world: SyntheticWorld, n_cameras=4, rate=60.0,
+                 noise=0.0, angle_noise=0.0, miss_rate=0.0,
+                 capture_latency=0.005, use_autoref=False, referee_rate=10.0,
+                 seed=None):
+        self.world = world
+        self.n_cameras = n_cameras
+        self.rate = rate
+        self.noise = noise  # [mm]
+        self.angle_noise = angle_noise  # [rad]
+        self.miss_rate = miss_rate
+        self.capture_latency = capture_latency  # [s]
+        self.use_autoref = use_autoref
+        self.referee_rate = referee_rate
+        self.rng = np.random.default_rng(seed)
+
+        self.camera_areas = self.split_field(n_cameras)
+        self.frame_numbers = [0] * n_cameras
+        self.wrapper_message = wrapper.SSL_WrapperPacket()
+        self.tracker_message = tigers_wrapper.TrackerWrapperPacket()
+        self.referee_message = referee.SSL_Referee()
+        self.init_referee_packet()
+
+        self.sent = dict()
+        self.max_late = 0.0  # [s] worst delay against the schedule
+
+    def split_field(self, n_cameras: int) -> [[float, float, float, float]]:
+        """
+        One [x_min, y_min, x_max, y_max] area per camera, in a grid of one or
+        two rows
+        """
+        rows = 1 if n_cameras <= 2 else 2
+        cols = ceil(n_cameras / rows)
+        length, width = self.world.field_size
+        areas = []
+        for camera_id in range(n_cameras):
+            row, col = divmod(camera_id, cols)
+            x_min = -length / 2 + col * length / cols
+            y_min = -width / 2 + row * width / rows
+            areas.append([x_min - CAMERA_OVERLAP, y_min - CAMERA_OVERLAP,
+                          x_min + length / cols + CAMERA_OVERLAP,
+                          y_min + width / rows + CAMERA_OVERLAP])
+        # The outer cameras also see the boundary
+        for area in areas:
+            for axis, half in ((0, length / 2), (1, width / 2)):
+                if area[axis] <= -half:
+                    area[axis] = -np.inf
+                if area[axis + 2] >= half:
+                    area[axis + 2] = np.inf
+        return areas
+
+    def init_referee_packet(self):
+        packet = self.referee_message
+        packet.stage = referee.SSL_Referee.NORMAL_FIRST_HALF
+        for team, name in ((packet.yellow, YELLOW_TEAM), (packet.blue, BLUE_TEAM)):
+            team.name = name
+            team.score = 0
+            team.red_cards = 0
+            team.yellow_cards = 0
+            team.timeouts = 4
+            team.timeout_time = 300000000
+            team.goalie = 0
+
+    def init_socket(self, ttl=0, interface=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                                    socket.IPPROTO_UDP)
+        # TTL 0 keeps the traffic in this host
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        if interface != None:
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                   socket.inet_aton(interface))
+
+# =============================================================================
+
+    def noisy(self, pos: [float, float, float]) -> [float, float, float]:
+        if self.noise > 0:
+            pos[0] += self.rng.normal(0, self.noise)
+            pos[1] += self.rng.normal(0, self.noise)
+        if self.angle_noise > 0:
+            pos[2] += self.rng.normal(0, self.angle_noise)
+        return pos
+
+    def is_seen(self, camera_id: int, pos: [float, float, float]) -> bool:
+        x_min, y_min, x_max, y_max = self.camera_areas[camera_id]
+        if not (x_min <= pos[0] <= x_max and y_min <= pos[1] <= y_max):
+            return False
+        return self.miss_rate <= 0 or self.rng.random() >= self.miss_rate
+
+    def vision_packet(self, camera_id: int, t: float, t_wall: float) -> bytes:
+        packet = self.wrapper_message
+        packet.Clear()
+        self.frame_numbers[camera_id] += 1
+
+        frame = packet.detection
+        frame.frame_number = self.frame_numbers[camera_id]
+        frame.t_capture = t_wall - self.capture_latency
+        frame.t_sent = t_wall
+        frame.camera_id = camera_id
+
+        ball_pos = self.world.ball.get_pos(t)
+        if self.is_seen(camera_id, ball_pos):
+            ball = frame.balls.add()
+            ball.confidence = 0.9
+            ball.x, ball.y, _ = self.noisy(ball_pos)
+            ball.pixel_x, ball.pixel_y = 0, 0
+
+        for robot in self.world.robots:
+            pos = robot.get_pos(t)
+            if not self.is_seen(camera_id, pos):
+                continue
+            if robot.team == BLUE_TEAM:
+                detection = frame.robots_blue.add()
+            else:
+                detection = frame.robots_yellow.add()
+            detection.confidence = 0.9
+            detection.robot_id = robot.robot_id
+            detection.x, detection.y, detection.orientation = self.noisy(pos)
+            detection.pixel_x, detection.pixel_y = 0, 0
+
+        frames_per_geometry = max(int(self.rate * GEOMETRY_PERIOD), 1)
+        if frame.frame_number % frames_per_geometry == 1:
+            field = packet.geometry.field
+            field.field_length, field.field_width = self.world.field_size
+            field.goal_width, field.goal_depth = 1000, 180
+            field.boundary_width = 300
+            field.penalty_area_depth, field.penalty_area_width = 1000, 2000
+
+        return packet.SerializeToString()
+
+    def tracker_packet(self, frame_number: int, t: float, t_wall: float) -> bytes:
+        packet = self.tracker_message
+        packet.Clear()
+        packet.uuid = 'TrafficGenerator'
+        packet.source_name = 'TrafficGenerator'
+
+        # The tracker uses meters
+        frame = packet.tracked_frame
+        frame.frame_number = frame_number
+        frame.timestamp = t_wall
+
+        ball = frame.balls.add()
+        x, y, _ = self.noisy(self.world.ball.get_pos(t))
+        ball.pos.x, ball.pos.y, ball.pos.z = x / 1e3, y / 1e3, 0.0
+
+        for robot in self.world.robots:
+            tracked = frame.robots.add()
+            tracked.robot_id.id = robot.robot_id
+            tracked.robot_id.team = TRACKER_TEAMS[robot.team]
+            x, y, theta = self.noisy(robot.get_pos(t))
+            tracked.pos.x, tracked.pos.y = x / 1e3, y / 1e3
+            tracked.orientation = theta
+
+        return packet.SerializeToString()
+
+    def referee_data(self, t: float, t_wall: float) -> bytes:
+        packet = self.referee_message
+        counter, command = self.world.get_referee_command(t)
+        if counter != packet.command_counter or not packet.HasField('command'):
+            packet.command_timestamp = int(t_wall * 1e6)
+        packet.command = referee.SSL_Referee.Command.Value(command)
+        packet.command_counter = counter
+        packet.packet_timestamp = int(t_wall * 1e6)
+        return packet.SerializeToString()
+
+# =============================================================================
+
+    def run(self, vision_address: (str, int), referee_address: (str, int),
+            duration=0):
+        """
+        Sends every stream on its own schedule until duration (seconds, 0 runs
+        until Ctrl+C). The cameras are evenly phase shifted
+        """
+        autoref_address = (vision_address[0], AUTOREF_TRACKED_PORT)
+        period = 1 / self.rate
+        # [next send time, stream]
+        schedule = [[camera_id * period / self.n_cameras, camera_id]
+                    for camera_id in range(self.n_cameras)]
+        if self.use_autoref:
+            schedule.append([0, 'AUTOREF'])
+        if self.referee_rate > 0:
+            schedule.append([0, 'REFEREE'])
+
+        self.sent = {stream: 0 for _, stream in schedule}
+        autoref_frames = 0
+        t_start = time.monotonic()
+
+        try:
+            while True:
+                event = min(schedule, key=lambda event: event[0])
+                t_next, stream = event
+                if duration > 0 and t_next >= duration:
+                    break
+
+                delay = t_start + t_next - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.max_late = max(self.max_late, -delay)
+
+                t = time.monotonic() - t_start
+                t_wall = time.time()
+                if stream == 'AUTOREF':
+                    autoref_frames += 1
+                    self.socket.sendto(self.tracker_packet(autoref_frames, t,
+                                                           t_wall),
+                                       autoref_address)
+                    event[0] += period
+                elif stream == 'REFEREE':
+                    self.socket.sendto(self.referee_data(t, t_wall),
+                                       referee_address)
+                    event[0] += 1 / self.referee_rate
+                else:
+                    self.socket.sendto(self.vision_packet(stream, t, t_wall),
+                                       vision_address)
+                    event[0] += period
+                self.sent[stream] += 1
+        except KeyboardInterrupt:
+            pass
+
+        self.print_stats(time.monotonic() - t_start)
+
+    def print_stats(self, dt: float):
+        for stream, sent in self.sent.items():
+            name = f'Camera {stream}' if isinstance(stream, int) else stream
+            blue_print('[GEN] {}: {} packets, {:.1f} Hz'.format(name, sent,
+                                                                 sent / dt))
+        blue_print('[GEN] Max delay against the schedule = {:.2f} ms'.format(
+            1e3 * self.max_late))
+
+# =============================================================================
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-p', '--vision-port', required=False,
+                            help='UDP Vision Port, default value is {}'.format(
+                                DEFAULT_VISION_PORT),
+                            default=DEFAULT_VISION_PORT)
+    arg_parser.add_argument('-i', '--vision-ip', required=False,
+                            help='UDP Vision IP, default value is {}'.format(
+                                DEFAULT_VISION_IP),
+                            default=DEFAULT_VISION_IP)
+    arg_parser.add_argument('-P', '--referee-port', required=False,
+                            help='UDP Referee Port, default value is {}'.format(
+                                DEFAULT_REFEREE_PORT),
+                            default=DEFAULT_REFEREE_PORT)
+    arg_parser.add_argument('-I', '--referee-ip', required=False,
+                            help='UDP Referee IP, default value is {}'.format(
+                                DEFAULT_REFEREE_IP),
+                            default=DEFAULT_REFEREE_IP)
+    arg_parser.add_argument('-n', '--cameras', required=False,
+                            help='Number of cameras, default is 4',
+                            default=4)
+    arg_parser.add_argument('-r', '--rate', required=False,
+                            help='Frame rate of each camera (and of the tracker) in Hz, default is 60',
+                            default=60)
+    arg_parser.add_argument('-R', '--robots', required=False,
+                            help='Robots per team when no challenge file is given, default is 6',
+                            default=6)
+    arg_parser.add_argument('-f', '--challenge-file', required=False,
+                            help='Places the robots and the ball as in this challenge JSON file',
+                            default=None)
+    arg_parser.add_argument('-s', '--script', required=False,
+                            help='JSON file with the robot/ball waypoints and referee commands',
+                            default=None)
+    arg_parser.add_argument('-A', '--autoref', required=False,
+                            help='Also publish AutoRef tracked data (1/0), default is 0',
+                            default=0)
+    arg_parser.add_argument('--referee-rate', required=False,
+                            help='Referee packets per second, 0 disables them, default is 10',
+                            default=10)
+    arg_parser.add_argument('--noise', required=False,
+                            help='Position noise (standard deviation) in mm, default is 0',
+                            default=0)
+    arg_parser.add_argument('--angle-noise', required=False,
+                            help='Orientation noise (standard deviation) in rad, default is 0',
+                            default=0)
+    arg_parser.add_argument('--miss-rate', required=False,
+                            help='Probability of an object not being detected by a camera, default is 0',
+                            default=0)
+    arg_parser.add_argument('--capture-latency', required=False,
+                            help='Difference between t_sent and t_capture in ms, default is 5',
+                            default=5)
+    arg_parser.add_argument('--seed', required=False,
+                            help='Seed of the noise generator',
+                            default=None)
+    arg_parser.add_argument('-d', '--duration', required=False,
+                            help='Seconds to run, default is 0 (until Ctrl+C)',
+                            default=0)
+    arg_parser.add_argument('--ttl', required=False,
+                            help='Multicast TTL, default is 0 (only this host)',
+                            default=0)
+    arg_parser.add_argument('--interface', required=False,
+                            help='IP of the interface used to send the multicast traffic',
+                            default=None)
+    return vars(arg_parser.parse_args())
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    world = SyntheticWorld(n_robots=int(args['robots']))
+    for key, load in (('challenge_file', world.load_challenge),
+                      ('script', world.load_script)):
+        if args[key] != None:
+            if not isfile(args[key]):
+                red_print(f'File {args[key]} not found')
+                exit(1)
+            load(args[key])
+
+    generator = TrafficGenerator(world, n_cameras=int(args['cameras']),
+                                 rate=float(args['rate']),
+                                 noise=float(args['noise']),
+                                 angle_noise=float(args['angle_noise']),
+                                 miss_rate=float(args['miss_rate']),
+                                 capture_latency=float(
+                                     args['capture_latency']) / 1e3,
+                                 use_autoref=bool(int(args['autoref'])),
+                                 referee_rate=float(args['referee_rate']),
+                                 seed=int(args['seed']) if args['seed'] != None else None)
+    generator.init_socket(int(args['ttl']), args['interface'])
+
+    green_print('[GEN] {} cameras at {} Hz, {} robots'.format(
+        generator.n_cameras, generator.rate, len(world.robots)))
+    generator.run((args['vision_ip'], int(args['vision_port'])),
+                  (args['referee_ip'], int(args['referee_port'])),
+                  float(args['duration']))
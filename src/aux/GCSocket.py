@@ -93,3 +93,19 @@ class GCSocket(object):
             red_print('[W Socket]', expt, type(expt))
 
         return False
+
+
+class DryRunGCSocket(GCSocket):
+    """
+    Only prints the commands, used when replaying a log without a Game
+    Controller
+    """
+
+    def __init__(self):
+        self.w_socket = None
+        self.placement_pos = [0.0, 0.0]
+        purple_print('[W Socket] Dry run, the GC commands are not sent')
+
+    def send_command(self, gc_command: GCCommands, team=None) -> bool:
+        purple_print(f'[W Socket] {gc_command.name} ({team})')
+        return True
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from math import sqrt, pow, pi
 from aux.utils import red_print
+from aux import clock
 
 import numpy as np
 
@@ -8,13 +9,16 @@ BLUE_TEAM = 'BLUE'
 YELLOW_TEAM = 'YELLOW'
 BALL = 'ORANGE'
 
-MAX_FRAMES_UNSEEN = 50
+VISIBILITY_TIMEOUT = 1.0  # [s] without detections before leaving the vision
 DISTANCE_THRESHOLD = 35  # [mm]
 ORIENTATION_THRESHOLD = 10 * pi/180.0  # [rad]
 INF = 999999999999
+NEVER_SEEN = -float('inf')
 
 
 class Position(object):
+    __slots__ = ('x', 'y', 'orientation')
+
     def __init__(self, x=INF, y=INF, orientation=0):
         self.x = x
         self.y = y
@@ -23,6 +27,16 @@ class Position(object):
     def __repr__(self):
         return '({}, {}, {:.3f})'.format(self.x, self.y, self.orientation)
 
+    def __reduce__(self):
+        # Pickled as the constructor arguments, smaller and faster than the
+        # default state of a slotted object
+        return (Position, (self.x, self.y, self.orientation))
+
+    def update(self, x: float, y: float, orientation=0):
+        self.x = x
+        self.y = y
+        self.orientation = float(orientation)
+
     def set_pos(self, pos: Position):
         self.x = pos.x
         self.y = pos.y
@@ -34,67 +48,77 @@ class Position(object):
         return round(sqrt(pow(self.x - pos.x, 2) + pow(self.y - pos.y, 2)))
 
     def distance_orientation(self, pos) -> float:
-        return abs(abs(self.orientation) - abs(pos.orientation))
+        # Wrapped to [-pi, pi), so -pi and pi are the same orientation
+        return abs((self.orientation - pos.orientation + pi) % (2 * pi) - pi)
 
 # =============================================================================
 
 
 class VisionObject(object):
+    __slots__ = ('last_seen', 'pos')
+
     def __init__(self):
-        self.unseen_frames = 0
+        self.last_seen = NEVER_SEEN  # clock.monotonic() of the last detection
         self.pos = Position()
 
+    def __getstate__(self):
+        return (self.last_seen, self.pos)
+
+    def __setstate__(self, state):
+        self.last_seen, self.pos = state
+
     def update(self, **kargs):
         raise NotImplementedError()
 
-    def in_vision(self) -> bool:
-        return self.unseen_frames > 0
+    def in_vision(self, timeout=VISIBILITY_TIMEOUT) -> bool:
+        return clock.monotonic() - self.last_seen <= timeout
+
+    def seen(self):
+        self.last_seen = clock.monotonic()
 
 # =============================================================================
 
 
 class Robot(VisionObject):
-    def __init__(self, **kargs):
+    __slots__ = ('id', 'team')
+
+    def __init__(self, robot_id=-1, team=BLUE_TEAM, pos=None, obj=None,
+                 id=None):
         super().__init__()
-        self.id = -1
-        self.team = BLUE_TEAM
-
-        for key, value in kargs.items():
-            if key == 'robot_id':
-                self.id = value
-            elif key == 'pos':
-                self.pos = value
-            elif key == 'team':
-                self.team = value
-            elif key == 'obj':
-                self.pos = Position(*tuple(value['pos']))
-            elif key == 'id':
-                self.id = value['number']
-                self.team = value['color']
+        self.id = robot_id
+        self.team = team
+
+        if pos != None:
+            self.pos = pos
+        if obj != None:
+            self.pos.update(*obj['pos'])
+        if id != None:
+            self.id = id['number']
+            self.team = id['color']
 
     def __repr__(self):
         if self.in_vision():
             return 'Robot {}/{} = {}'.format(self.id, self.team, self.pos)
         return ''
 
-    def update(self,  **kargs):
-        is_robot = False
-        pos = None
-
-        for key, value in kargs.items():
-            if key == 'id':
-                if value['number'] == self.id and value['color'] == self.team:
-                    is_robot = True
+    def __getstate__(self):
+        return (self.last_seen, self.pos, self.id, self.team)
 
-            elif key == 'obj':
-                pos = Position(*tuple(value['pos']))
+    def __setstate__(self, state):
+        self.last_seen, self.pos, self.id, self.team = state
 
-        if is_robot and pos != None:
-            self.pos = pos
-            self.unseen_frames = MAX_FRAMES_UNSEEN
+    def update(self, id=None, obj=None):
+        """
+        Detection as parsed from the JSON files, ignored if it belongs to
+        another robot
+        """
+        if id != None and obj != None and \
+                id['number'] == self.id and id['color'] == self.team:
+            self.update_pos(*obj['pos'])
 
-        elif self.in_vision():
-            self.unseen_frames = self.unseen_frames - 1
+    def update_pos(self, x: float, y: float, orientation: float):
+        self.pos.update(x, y, orientation)
+        self.seen()
 
     def compare(self, data: Robot):
         if not self.in_vision():
@@ -110,6 +134,8 @@ class Robot(VisionObject):
 
 
 class Ball(VisionObject):
+    __slots__ = ()
+
     def __init__(self, pos=None):
         super().__init__()
 
@@ -119,25 +145,18 @@ class Ball(VisionObject):
     def __repr__(self):
         return 'Ball = {}'.format(self.pos)
 
-    def update(self, **kargs):
-        pos = None
-        for key, data in kargs.items():
-            if 'pos' == key:
-                pos = Position(*tuple(data['pos']))
-
+    def update(self, pos=None):
         if pos == None:
-            red_print('Ball update | No position given in {}'.format(kargs))
+            red_print('Ball update | No position given in {}'.format(pos))
             return
-
-        if self.in_vision():
-            if pos.distance(Position()) != 0:
-                self.unseen_frames = MAX_FRAMES_UNSEEN
-                self.pos = pos
-        else:
-            self.unseen_frames = MAX_FRAMES_UNSEEN
-            self.pos = pos
-
-        self.unseen_frames = self.unseen_frames - 1
+        self.update_pos(*pos['pos'][:2])
+
+    def update_pos(self, x: float, y: float):
+        # While the ball is in vision, an unknown position is ignored
+        if not self.in_vision() or \
+                round(sqrt(pow(x - INF, 2) + pow(y - INF, 2))) != 0:
+            self.pos.update(x, y)
+            self.seen()
 
     def compare(self, data: Ball):
         if not self.in_vision():
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def linear_sum_assignment(cost: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Minimum cost assignment between the rows and the columns of a cost
+    matrix (Hungarian algorithm with shortest augmenting paths, O(n^2 m)).
+    Returns the row and column indexes of the assigned pairs sorted by row,
+    like scipy.optimize.linear_sum_assignment, every row is assigned when
+    there are fewer rows than columns and vice versa
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.ndim != 2:
+        raise ValueError('The cost matrix must be 2D')
+    if cost.size == 0:
+        return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+    if not np.all(np.isfinite(cost)):
+        raise ValueError('The cost matrix must be finite')
+
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n_rows, n_cols = cost.shape
+
+    # Index 0 is a virtual column, row_of[j] is the row (1-based) assigned
+    # to the column j (0 if free) and u, v are the dual potentials
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    row_of = np.zeros(n_cols + 1, dtype=np.intp)
+    way = np.zeros(n_cols + 1, dtype=np.intp)
+
+    for row in range(1, n_rows + 1):
+        row_of[0] = row
+        col = 0
+        min_v = np.full(n_cols + 1, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+
+        # Dijkstra-like search of the shortest augmenting path
+        while row_of[col] != 0:
+            used[col] = True
+            current_row = row_of[col]
+            free = ~used
+            free[0] = False
+
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            better = free[1:] & (reduced < min_v[1:])
+            min_v[1:][better] = reduced[better]
+            way[1:][better] = col
+
+            next_col = int(np.argmin(np.where(free, min_v, np.inf)))
+            delta = min_v[next_col]
+            u[row_of[used]] += delta
+            v[used] -= delta
+            min_v[free] -= delta
+            col = next_col
+
+        # Flip the assignments along the path
+        while col != 0:
+            previous_col = way[col]
+            row_of[col] = row_of[previous_col]
+            col = previous_col
+
+    cols = np.flatnonzero(row_of[1:])
+    rows = row_of[cols + 1] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return (rows[order], cols[order])
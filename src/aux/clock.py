@@ -0,0 +1,30 @@
+import time
+
+# Every challenge/positioning timer reads the time from here, so a replayed
+# log can drive them with the time of the recording instead of the wall clock
+_time_source = time.time
+_monotonic_source = time.monotonic
+
+
+def now() -> float:
+    """
+    Current time in seconds
+    """
+    return _time_source()
+
+
+def monotonic() -> float:
+    """
+    Monotonic time in seconds, used for the timeouts
+    """
+    return _monotonic_source()
+
+
+def set_time_source(time_source=None):
+    """
+    Replaces the clock with a function that returns the time in seconds,
+    None restores the wall clock. The new clock drives the timeouts too
+    """
+    global _time_source, _monotonic_source
+    _time_source = time_source if time_source != None else time.time
+    _monotonic_source = time_source if time_source != None else time.monotonic
@@ -0,0 +1,119 @@
+import numpy as np
+
+from aux.RobotBall import BLUE_TEAM, YELLOW_TEAM, BALL
+
+# Values of the team column
+BLUE_CODE = 0
+YELLOW_CODE = 1
+BALL_CODE = 2
+TEAM_CODES = {BLUE_TEAM: BLUE_CODE, YELLOW_TEAM: YELLOW_CODE, BALL: BALL_CODE}
+TRACKER_TEAM_CODES = {1: YELLOW_CODE, 2: BLUE_CODE}  # ssl_gc_common Team
+
+NO_CAMERA = -1  # tracked data, or fused from more than one camera
+
+# x, y in mm, theta in rad, t_capture in seconds (vision time), vx, vy in
+# mm/s and omega in rad/s (from the tracker or aux.prediction). t_local is
+# the capture time in the aux.clock.monotonic() time of this computer:
+# receive time - (t_sent - t_capture), 0 if unknown
+DETECTION_DTYPE = np.dtype([('team', np.uint8), ('id', np.uint8),
+                            ('x', np.float64), ('y', np.float64),
+                            ('theta', np.float64),
+                            ('confidence', np.float32),
+                            ('camera', np.int16),
+                            ('t_capture', np.float64),
+                            ('vx', np.float64), ('vy', np.float64),
+                            ('omega', np.float64),
+                            ('t_local', np.float64)])
+MAX_DETECTIONS = 64  # per frame, grows if a frame has more
+
+
+class DetectionArray(object):
+    """
+    Preallocated structured array filled straight from the repeated fields of
+    a detection frame, only the first `size` rows are valid
+    """
+
+    def __init__(self, capacity=MAX_DETECTIONS):
+        self.data = np.zeros(capacity, dtype=DETECTION_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+
+    def rows(self) -> np.ndarray:
+        """
+        View of the valid rows, overwritten by the next fill
+        """
+        return self.data[:self.size]
+
+    def reserve(self, capacity: int):
+        if capacity > len(self.data):
+            data = np.zeros(max(capacity, 2 * len(self.data)),
+                            dtype=DETECTION_DTYPE)
+            data[:self.size] = self.rows()
+            self.data = data
+
+    def append(self, team: int, robot_id: int, x: float, y: float,
+               theta: float, confidence: float, camera: int,
+               t_capture: float, vx=0.0, vy=0.0, omega=0.0, t_local=0.0):
+        if self.size == len(self.data):
+            self.reserve(self.size + 1)
+        self.data[self.size] = (team, robot_id, x, y, theta, confidence,
+                                camera, t_capture, vx, vy, omega, t_local)
+        self.size += 1
+
+    def copy_from(self, rows: np.ndarray):
+        self.size = 0
+        self.reserve(len(rows))
+        self.data[:len(rows)] = rows
+        self.size = len(rows)
+
+# =============================================================================
+
+    def fill_from_detection(self, frame, rx_time=0.0) -> np.ndarray:
+        """
+        SSL_DetectionFrame (raw SSL-Vision), rx_time is the local receive
+        time of the packet (0 if unknown)
+        """
+        self.clear()
+        camera, t_capture = frame.camera_id, frame.t_capture
+        # Only durations measured by a single clock are used, so the vision
+        # and local clocks don't need to be synchronized
+        t_local = rx_time - (frame.t_sent - t_capture) if rx_time > 0 else 0.0
+
+        for ball in frame.balls:
+            self.append(BALL_CODE, 0, ball.x, ball.y, 0.0, ball.confidence,
+                        camera, t_capture, t_local=t_local)
+        for team, robots in ((BLUE_CODE, frame.robots_blue),
+                             (YELLOW_CODE, frame.robots_yellow)):
+            for robot in robots:
+                self.append(team, robot.robot_id, robot.x, robot.y,
+                            robot.orientation, robot.confidence, camera,
+                            t_capture, t_local=t_local)
+        return self.rows()
+
+    def fill_from_tracked(self, frame, rx_time=0.0) -> np.ndarray:
+        """
+        TrackedFrame (TIGERs AutoRef), positions in m. The tracker doesn't
+        send its processing time, the receive time is used as t_local
+        """
+        self.clear()
+        t_capture = frame.timestamp
+        t_local = rx_time
+
+        for ball in frame.balls:
+            self.append(BALL_CODE, 0, 1e3 * ball.pos.x, 1e3 * ball.pos.y, 0.0,
+                        ball.visibility if ball.HasField('visibility') else 1.0,
+                        NO_CAMERA, t_capture, 1e3 * ball.vel.x, 1e3 * ball.vel.y,
+                        t_local=t_local)
+        for robot in frame.robots:
+            self.append(TRACKER_TEAM_CODES.get(robot.robot_id.team, YELLOW_CODE),
+                        robot.robot_id.id, 1e3 * robot.pos.x, 1e3 * robot.pos.y,
+                        robot.orientation,
+                        robot.visibility if robot.HasField('visibility') else 1.0,
+                        NO_CAMERA, t_capture, 1e3 * robot.vel.x,
+                        1e3 * robot.vel.y, robot.vel_angular, t_local)
+        return self.rows()
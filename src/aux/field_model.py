@@ -0,0 +1,161 @@
+from __future__ import annotations
+import numpy as np
+
+LEFT_SIDE = 'LEFT'
+RIGHT_SIDE = 'RIGHT'
+
+DEFAULT_CENTER_CIRCLE_RADIUS = 500  # [mm]
+DEFAULT_LINE_THICKNESS = 10  # [mm]
+
+
+class FieldLine(object):
+    def __init__(self, name: str, p1: [float, float], p2: [float, float],
+                 thickness=DEFAULT_LINE_THICKNESS):
+        self.name = name
+        self.p1 = np.array(p1, dtype=float)
+        self.p2 = np.array(p2, dtype=float)
+        self.thickness = thickness
+
+    def __repr__(self):
+        return '{} = {} -> {}'.format(self.name, self.p1, self.p2)
+
+
+class FieldArc(object):
+    def __init__(self, name: str, center: [float, float], radius: float,
+                 a1: float, a2: float, thickness=DEFAULT_LINE_THICKNESS):
+        self.name = name
+        self.center = np.array(center, dtype=float)
+        self.radius = radius
+        self.a1 = a1  # [rad]
+        self.a2 = a2  # [rad]
+        self.thickness = thickness
+
+    def __repr__(self):
+        return '{} = {}, r = {}'.format(self.name, self.center, self.radius)
+
+# =============================================================================
+
+
+class FieldModel(object):
+    """
+    Complete description of the field, built once from the SSL-Vision
+    geometry. All the values are in mm
+    """
+
+    def __init__(self, field_length=0, field_width=0, goal_width=0,
+                 goal_depth=0, boundary_width=0, penalty_area_depth=0,
+                 penalty_area_width=0):
+        self.field_length = field_length
+        self.field_width = field_width
+        self.goal_width = goal_width
+        self.goal_depth = goal_depth
+        self.boundary_width = boundary_width
+        self.penalty_area_depth = penalty_area_depth
+        self.penalty_area_width = penalty_area_width
+        self.center_circle_radius = DEFAULT_CENTER_CIRCLE_RADIUS
+
+        self.lines = []
+        self.arcs = []
+        self.goals = dict()
+        self.penalty_areas = dict()
+
+    def __repr__(self):
+        return 'Field {}x{}, {} lines, {} arcs'.format(self.field_length,
+                                                      self.field_width,
+                                                      len(self.lines),
+                                                      len(self.arcs))
+
+    @staticmethod
+    def from_geometry(field) -> FieldModel:
+        """
+        Builds the model from a SSL_GeometryFieldSize message
+        """
+        model = FieldModel(field.field_length, field.field_width,
+                           field.goal_width, field.goal_depth,
+                           field.boundary_width, field.penalty_area_depth,
+                           field.penalty_area_width)
+
+        model.lines = [FieldLine(line.name, [line.p1.x, line.p1.y],
+                                 [line.p2.x, line.p2.y], line.thickness)
+                       for line in field.field_lines]
+        model.arcs = [FieldArc(arc.name, [arc.center.x, arc.center.y],
+                               arc.radius, arc.a1, arc.a2, arc.thickness)
+                      for arc in field.field_arcs]
+
+        for arc in model.arcs:
+            if arc.name == 'CenterCircle':
+                model.center_circle_radius = arc.radius
+
+        model.precompute()
+        return model
+
+# =============================================================================
+
+    def precompute(self):
+        half_length = self.field_length / 2
+        half_goal = self.goal_width / 2
+        half_penalty = self.penalty_area_width / 2
+
+        # Goal outline: post on the goal line -> back of the goal -> post
+        self.goals = dict()
+        self.penalty_areas = dict()
+        for side, sign in ((LEFT_SIDE, -1), (RIGHT_SIDE, 1)):
+            goal_line = sign * half_length
+            goal_back = sign * (half_length + self.goal_depth)
+            self.goals[side] = np.array([[goal_line, -half_goal],
+                                         [goal_back, -half_goal],
+                                         [goal_back, half_goal],
+                                         [goal_line, half_goal]])
+
+            penalty_line = sign * (half_length - self.penalty_area_depth)
+            self.penalty_areas[side] = [min(goal_line, penalty_line),
+                                        -half_penalty,
+                                        max(goal_line, penalty_line),
+                                        half_penalty]
+
+        # Some sources don't send the field markings, build the standard ones
+        if len(self.lines) == 0:
+            self.lines = self.default_lines()
+        if len(self.arcs) == 0:
+            self.arcs = [FieldArc('CenterCircle', [0, 0],
+                                  self.center_circle_radius, 0, 2*np.pi)]
+
+    def default_lines(self) -> [FieldLine]:
+        half_length = self.field_length / 2
+        half_width = self.field_width / 2
+
+        lines = [FieldLine('TopTouchLine', [-half_length, half_width],
+                           [half_length, half_width]),
+                 FieldLine('BottomTouchLine', [-half_length, -half_width],
+                           [half_length, -half_width]),
+                 FieldLine('LeftGoalLine', [-half_length, -half_width],
+                           [-half_length, half_width]),
+                 FieldLine('RightGoalLine', [half_length, -half_width],
+                           [half_length, half_width]),
+                 FieldLine('HalfwayLine', [0, -half_width], [0, half_width]),
+                 FieldLine('CenterLine', [-half_length, 0], [half_length, 0])]
+
+        for side in (LEFT_SIDE, RIGHT_SIDE):
+            x_min, y_min, x_max, y_max = self.penalty_areas[side]
+            if x_max - x_min <= 0:
+                continue
+            penalty_x = x_max if side == LEFT_SIDE else x_min
+            goal_x = x_min if side == LEFT_SIDE else x_max
+            lines.extend([FieldLine(f'{side.title()}PenaltyStretch',
+                                    [penalty_x, y_min], [penalty_x, y_max]),
+                          FieldLine(f'{side.title()}FieldLeftPenaltyStretch',
+                                    [goal_x, y_max], [penalty_x, y_max]),
+                          FieldLine(f'{side.title()}FieldRightPenaltyStretch',
+                                    [goal_x, y_min], [penalty_x, y_min])])
+        return lines
+
+# =============================================================================
+
+    def get_size(self) -> [int, int]:
+        return [self.field_length, self.field_width]
+
+    def in_penalty_area(self, x: float, y: float) -> bool:
+        for x_min, y_min, x_max, y_max in self.penalty_areas.values():
+            if x_min <= x <= x_max and y_min <= y <= y_max:
+                return True
+        return False
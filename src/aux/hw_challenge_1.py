@@ -1,7 +1,8 @@
 import numpy as np
 from aux.challenge_aux import ChallengeSteps, ChallengeEvents, Action
 from aux.GCSocket import GCCommands
-from aux.RobotBall import Robot, DISTANCE_THRESHOLD
+from aux.RobotBall import DISTANCE_THRESHOLD
+from aux.world_state import ObjectState
 
 
 class Challenge_1(object):
@@ -42,11 +43,9 @@ class Challenge_1(object):
         return Action(False, timer=20)
 
     @staticmethod
-    def check_restriction(robots: [Robot]) -> (bool, int):
-        away_from_line = [1 for bot in robots
-                          if abs(bot.pos.x) > 100 and
-                          bot.in_vision()]
+    def check_restriction(robots: ObjectState) -> (bool, int):
+        away_from_line = (np.abs(robots.x) > 100) & robots.visible
 
-        if np.sum(np.array(away_from_line)) > 0:
+        if np.any(away_from_line):
             return False, 0
         return True, 0
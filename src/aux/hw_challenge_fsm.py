@@ -1,6 +1,6 @@
-import time
 from enum import Enum
 from aux.utils import red_print, blue_print, green_print, purple_print
+from aux import clock
 from aux.GCSocket import GCCommands
 
 from aux.hw_challenge_1 import Challenge_1
@@ -10,8 +10,10 @@ from aux.hw_challenge_4 import Challenge_4
 from aux.tc_ball_placement import BallPlacement
 
 from aux.challenge_aux import ChallengeSteps, ChallengeEvents, Action
+from aux.referee_state import RefereeEvent
 
 ROBOT_STOP_TRESHOLD = 5  # in seconds
+REFEREE_EVENT_DELAY = 1  # in seconds, referee events are ignored before it
 MAX_CHALLENGES = 5
 
 
@@ -26,20 +28,51 @@ class ChallengeFSM(object):
         self.dt_cmd = [0, 0]
         self.dt_chl = [0, 0]
 
-    def challenge_external_event(self, event: ChallengeEvents):
+        # Event of the current referee command, kept until it can be applied
+        self.pending_event = None
+
+    def challenge_external_event(self, event: ChallengeEvents) -> bool:
+        """
+        Returns False if the event can't be applied yet
+        """
         if event == ChallengeEvents.GOAL and self.current_challenge.id in [1, 2]:
             dt = self.dt_cmd[1] - self.dt_cmd[0]
-            if dt > 1:
-                self.finish_challenge()
+            if dt <= REFEREE_EVENT_DELAY:
+                return False
+            self.finish_challenge()
 
         elif event == ChallengeEvents.ROBOT_STOPPED and self.current_challenge.id == 3:
             self.finish_challenge()
 
         elif event == ChallengeEvents.STOP and self.current_challenge.id == 5:
             dt = self.dt_cmd[1] - self.dt_cmd[0]
-            if dt > 1 and self.current_step == ChallengeSteps.STEP_4:
-                purple_print('\nStop!')
-                self.finish_challenge()
+            if dt <= REFEREE_EVENT_DELAY or \
+                    self.current_step != ChallengeSteps.STEP_4:
+                return False
+            purple_print('\nStop!')
+            self.finish_challenge()
+
+        return True
+
+    def referee_event(self, event: RefereeEvent):
+        """
+        The referee command is only sent when it changes, so its event stays
+        pending until the current step accepts it (or the command changes)
+        """
+        if not event.command_changed:
+            return
+
+        self.pending_event = None
+        if event.state.command == 'HALT':
+            self.pending_event = ChallengeEvents.GOAL
+        elif event.state.command == 'STOP':
+            self.pending_event = ChallengeEvents.STOP
+        self.apply_pending_event()
+
+    def apply_pending_event(self):
+        if self.pending_event != None and \
+                self.challenge_external_event(self.pending_event):
+            self.pending_event = None
 
     def finish_challenge(self):
         self.proceed_step()
@@ -47,7 +80,7 @@ class ChallengeFSM(object):
 
         if self.current_step == ChallengeSteps.STEP_0 and \
                 self.challenge_end_callback != None:
-            self.dt_chl[1] = time.time_ns() / 1e9
+            self.dt_chl[1] = clock.now()
 
             blue_print('Stop challenge timer!')
 
@@ -94,35 +127,63 @@ class ChallengeFSM(object):
             ch_time = ch_time - ROBOT_STOP_TRESHOLD
         return ch_time
 
+    def time_to_next_step(self) -> float:
+        """
+        Returns how long (in seconds) until the current step must be checked
+        again, or None if it only advances with external events
+        """
+        action = self.current_challenge.Step(self.current_step)
+
+        if action.command != GCCommands.NONE:
+            return 0
+
+        if action.timer != 0:
+            if self.dt_cmd == [0, 0]:
+                return 0
+            dt = clock.now() - self.dt_cmd[0]
+            timeout = action.timer - dt
+            if self.pending_event != None and dt <= REFEREE_EVENT_DELAY:
+                # Wakes up when the pending referee event can be applied
+                timeout = min(timeout, REFEREE_EVENT_DELAY - dt + 0.01)
+            return max(timeout, 0)
+
+        return None
+
     def get_current_command(self) -> GCCommands:
         action = self.current_challenge.Step(self.current_step)
         timer_ended = False
 
         if action.timer != 0 and self.dt_cmd == [0, 0]:
-            self.dt_cmd[0] = time.time_ns() / 1e9
-            self.dt_cmd[1] = time.time_ns() / 1e9
+            self.dt_cmd[0] = clock.now()
+            self.dt_cmd[1] = clock.now()
 
         elif action.timer != 0 and self.dt_cmd[0] > 0:
-            self.dt_cmd[1] = time.time_ns() / 1e9
+            self.dt_cmd[1] = clock.now()
 
             dt = self.dt_cmd[1] - self.dt_cmd[0]
             print('Challenge time = {:.2f}/{} s'.format(dt, action.timer),
                   end='\r')
 
+            step = self.current_step
+            self.apply_pending_event()
+            if self.current_step != step:
+                # The pending referee event finished the step
+                return GCCommands.NONE
+
             if dt >= action.timer:
                 timer_ended = True
                 self.dt_cmd = [0, 0]
 
         if action.command != GCCommands.NONE or timer_ended:
             if action.start_timer and self.dt_chl[0] == 0:
-                self.dt_chl[0] = time.time_ns() / 1e9
+                self.dt_chl[0] = clock.now()
                 blue_print('Starting challenge timer...')
 
             self.proceed_step()
 
             if self.current_step == ChallengeSteps.STEP_0 and \
                     self.challenge_end_callback != None:
-                self.dt_chl[1] = time.time_ns() / 1e9
+                self.dt_chl[1] = clock.now()
 
                 if timer_ended:
                     blue_print('\nStop challenge timer - Timeout =(!')
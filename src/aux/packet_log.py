@@ -0,0 +1,311 @@
+import mmap
+import os
+import queue
+import struct
+import time
+import numpy as np
+from threading import Thread
+
+from aux.utils import red_print, blue_print, green_print, purple_print
+
+# File layout:
+#   header: magic, version, wall clock and monotonic time of the recording start
+#   records: source id (uint8), monotonic receive time [s] (double),
+#            length (uint32), raw datagram
+# Sidecar index (<log>.idx): one (second since start, record offset) entry for
+# the first record of every second that has data
+LOG_MAGIC = b'SSLHWLOG'
+LOG_VERSION = 1
+FILE_HEADER = struct.Struct('<8sHdd')
+RECORD_HEADER = struct.Struct('<BdI')
+INDEX_ENTRY = struct.Struct('<IQ')
+INDEX_SUFFIX = '.idx'
+
+VISION_LOG_ID = 0
+AUTOREF_LOG_ID = 1
+REFEREE_LOG_ID = 2
+
+# Standard SSL log format (ssl-logtools), big endian:
+#   header: "SSL_LOG_FILE", version (int32)
+#   messages: receive time [ns] (int64), type (int32), size (int32), data
+SSL_LOG_MAGIC = b'SSL_LOG_FILE'
+SSL_LOG_HEADER = struct.Struct('>12si')
+SSL_LOG_MESSAGE = struct.Struct('>qii')
+SSL_LOG_SOURCE_IDS = {3: REFEREE_LOG_ID,  # MESSAGE_SSL_REFBOX_2013
+                      4: VISION_LOG_ID,  # MESSAGE_SSL_VISION_2014
+                      5: AUTOREF_LOG_ID}  # MESSAGE_SSL_VISION_TRACKER_2020
+
+WRITE_BUFFER_SIZE = 1 << 20  # [bytes]
+MAX_PENDING_RECORDS = 1 << 16
+FLUSH_PERIOD = 1.0  # [s]
+
+
+def index_filename(filename: str) -> str:
+    return filename + INDEX_SUFFIX
+
+
+class PacketLogWriter(object):
+    """
+    Appends raw datagrams to a binary log from a background thread, write()
+    only copies the datagram and queues it so it never blocks the caller
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.log_file = open(filename, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self.index_file = open(index_filename(filename), 'wb')
+
+        self.start_time = time.time()
+        self.start_monotonic = time.monotonic()
+        self.log_file.write(FILE_HEADER.pack(LOG_MAGIC, LOG_VERSION,
+                                             self.start_time,
+                                             self.start_monotonic))
+        self.offset = FILE_HEADER.size
+        self.last_second = -1
+
+        self.records = queue.Queue(MAX_PENDING_RECORDS)
+        self.written = 0
+        self.written_bytes = 0
+        self.dropped = 0  # writer thread too slow, the queue was full
+
+        self.writer_thread = Thread(target=self.write_loop, daemon=True)
+        self.writer_thread.start()
+        green_print(f'[LOG] Recording to {filename}')
+
+    def write(self, source_id: int, rx_monotonic: float, packet):
+        try:
+            self.records.put_nowait((source_id, rx_monotonic, bytes(packet)))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.records.put(None)
+        self.writer_thread.join()
+        self.log_file.close()
+        self.index_file.close()
+        green_print(f'[LOG] {self.written} packets saved to {self.filename}')
+
+# =============================================================================
+
+    def write_loop(self):
+        while True:
+            try:
+                record = self.records.get(timeout=FLUSH_PERIOD)
+            except queue.Empty:
+                self.flush()
+                continue
+
+            if record == None:
+                self.flush()
+                return
+            self.write_record(*record)
+
+    def write_record(self, source_id: int, rx_monotonic: float, packet: bytes):
+        second = int(rx_monotonic - self.start_monotonic)
+        if second > self.last_second:
+            self.index_file.write(INDEX_ENTRY.pack(second, self.offset))
+            self.last_second = second
+
+        self.log_file.write(RECORD_HEADER.pack(source_id, rx_monotonic,
+                                               len(packet)))
+        self.log_file.write(packet)
+        self.offset += RECORD_HEADER.size + len(packet)
+        self.written += 1
+        self.written_bytes += len(packet)
+
+    def flush(self):
+        try:
+            self.log_file.flush()
+            self.index_file.flush()
+        except OSError as except_type:
+            red_print('[LOG]', except_type)
+
+    def print_stats(self):
+        blue_print('[LOG] Recorded = {}, Bytes = {}, Pending = {}, Dropped = {}'.format(
+            self.written, self.written_bytes, self.records.qsize(),
+            self.dropped))
+
+# =============================================================================
+
+
+class LogReader(object):
+    """
+    Memory maps a datagram log, the records are returned as memoryviews of the
+    mapped file so nothing is copied. Times are wall clock seconds
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as log_file:
+            self.data = mmap.mmap(log_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+
+        self.start_time = None  # origin of the index seconds
+        self.end_time = 0.0
+        self.data_offset = self.read_header()
+        self.index_seconds = np.zeros(0, dtype=np.uint32)
+        self.index_offsets = np.zeros(0, dtype=np.uint64)
+        self.load_index()
+
+    def close(self):
+        self.view.release()
+        try:
+            self.data.close()
+        except BufferError:
+            # A record is still referenced, the GC will unmap the file
+            pass
+
+    def read_header(self) -> int:
+        """
+        Validates the file header and returns the offset of the first record
+        """
+        raise NotImplementedError
+
+    def read_record(self, offset: int) -> (int, float, memoryview, int):
+        """
+        Returns the source id (or None to skip the record), the receive time,
+        the datagram and the offset of the next record
+        """
+        raise NotImplementedError
+
+    def records(self, offset=None):
+        """
+        Yields (source id, receive time, datagram) starting at offset
+        """
+        if offset == None:
+            offset = self.data_offset
+        size = len(self.data)
+        while offset < size:
+            try:
+                source_id, rx_time, packet, offset = self.read_record(offset)
+            except struct.error:
+                red_print(f'[LOG] Truncated record at {offset}')
+                return
+            if source_id != None:
+                yield source_id, rx_time, packet
+
+# =============================================================================
+
+    def load_index(self):
+        index = self.read_index()
+        if index == None:
+            index = self.build_index()
+        self.index_seconds, self.index_offsets = index
+
+    def read_index(self) -> (np.array, np.array):
+        return None
+
+    def build_index(self) -> (np.array, np.array):
+        """
+        Scans the record headers once, for logs without a sidecar index
+        """
+        seconds, offsets = [], []
+        offset = self.data_offset
+        size = len(self.data)
+        while offset < size:
+            try:
+                source_id, rx_time, _, next_offset = self.read_record(offset)
+            except struct.error:
+                break
+            if source_id != None:
+                if self.start_time == None:
+                    self.start_time = rx_time
+                second = int(rx_time - self.start_time)
+                if len(seconds) == 0 or second > seconds[-1]:
+                    seconds.append(second)
+                    offsets.append(offset)
+                self.end_time = rx_time
+            offset = next_offset
+        if self.start_time == None:
+            self.start_time = 0.0
+        return (np.array(seconds, dtype=np.uint32),
+                np.array(offsets, dtype=np.uint64))
+
+    def find_offset(self, t: float) -> int:
+        """
+        Offset of the first record of the second t (seconds since the start of
+        the log)
+        """
+        position = np.searchsorted(self.index_seconds, int(max(t, 0)),
+                                   side='right') - 1
+        if position < 0:
+            return self.data_offset
+        return int(self.index_offsets[position])
+
+    def get_duration(self) -> float:
+        return self.end_time - self.start_time
+
+# =============================================================================
+
+
+class PacketLogReader(LogReader):
+    """
+    Reads the logs saved by PacketLogWriter
+    """
+
+    def read_header(self) -> int:
+        magic, version, self.log_start_time, self.log_start_monotonic = \
+            FILE_HEADER.unpack_from(self.data, 0)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f'{self.filename} is not a packet log (version {LOG_VERSION})')
+        # The writer counts the index seconds from the recording start
+        self.start_time = self.log_start_time
+        return FILE_HEADER.size
+
+    def read_record(self, offset: int) -> (int, float, memoryview, int):
+        source_id, rx_monotonic, length = RECORD_HEADER.unpack_from(self.data,
+                                                                    offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > len(self.data):
+            # The recording was killed while writing the last record
+            raise struct.error('record out of bounds')
+        rx_time = self.log_start_time + rx_monotonic - self.log_start_monotonic
+        return source_id, rx_time, self.view[start:start + length], \
+            start + length
+
+    def read_index(self) -> (np.array, np.array):
+        index_file = index_filename(self.filename)
+        if not os.path.isfile(index_file) or os.path.getsize(index_file) == 0:
+            return None
+
+        index = np.fromfile(index_file, dtype=np.dtype([('second', '<u4'),
+                                                        ('offset', '<u8')]))
+        # The index may be a bit behind the log if the recording was killed
+        index = index[index['offset'] < len(self.data)]
+        if len(index) == 0:
+            return None
+
+        for _, self.end_time, _ in self.records(int(index['offset'][-1])):
+            pass
+        return index['second'], index['offset']
+
+
+class SSLLogReader(LogReader):
+    """
+    Reads the standard SSL log format, only the vision 2014, tracker and
+    referee messages are used
+    """
+
+    def read_header(self) -> int:
+        magic, version = SSL_LOG_HEADER.unpack_from(self.data, 0)
+        if magic != SSL_LOG_MAGIC:
+            raise ValueError(f'{self.filename} is not a SSL log file')
+        return SSL_LOG_HEADER.size
+
+    def read_record(self, offset: int) -> (int, float, memoryview, int):
+        timestamp, message_type, size = SSL_LOG_MESSAGE.unpack_from(self.data,
+                                                                    offset)
+        start = offset + SSL_LOG_MESSAGE.size
+        if size < 0 or start + size > len(self.data):
+            raise struct.error('message out of bounds')
+        return SSL_LOG_SOURCE_IDS.get(message_type), timestamp / 1e9, \
+            self.view[start:start + size], start + size
+
+
+def open_log(filename: str) -> LogReader:
+    with open(filename, 'rb') as log_file:
+        magic = log_file.read(len(SSL_LOG_MAGIC))
+    if magic == SSL_LOG_MAGIC:
+        return SSLLogReader(filename)
+    return PacketLogReader(filename)
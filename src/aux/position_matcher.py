@@ -0,0 +1,118 @@
+import numpy as np
+
+from aux.RobotBall import BLUE_TEAM, YELLOW_TEAM, BALL, DISTANCE_THRESHOLD, \
+    ORIENTATION_THRESHOLD
+from aux.world_state import WorldState
+from aux.assignment import linear_sum_assignment
+from aux.prediction import wrap_angle
+
+OBJECT_TYPES = (BLUE_TEAM, YELLOW_TEAM, BALL)
+NOT_ASSIGNED = -1
+
+
+class PositionMatcher(object):
+    """
+    Checks every challenge target against the world state at once: the
+    target x object distance and orientation error matrices of each object
+    type are computed with NumPy, then each visible object is assigned to at
+    most one target with the minimum total distance, so one robot can't
+    satisfy two targets
+    """
+
+    def __init__(self, targets: list):
+        self.n_targets = len(targets)
+        self.x = np.array([data.pos.x for data in targets], dtype=np.float64)
+        self.y = np.array([data.pos.y for data in targets], dtype=np.float64)
+        self.theta = np.array([data.pos.orientation for data in targets],
+                              dtype=np.float64)
+        # Indexes of the targets of each object type, the ball targets don't
+        # check the orientation
+        types = np.array([data.type for data in targets], dtype=object)
+        self.indexes = {obj_type: np.flatnonzero(types == obj_type)
+                        for obj_type in OBJECT_TYPES}
+
+        # Result of the last match: id of the object assigned to each target
+        # and the vector from the object to the target (NaN if not assigned)
+        self.assigned = np.full(self.n_targets, NOT_ASSIGNED, dtype=np.intp)
+        self.dx = np.full(self.n_targets, np.nan)  # [mm]
+        self.dy = np.full(self.n_targets, np.nan)  # [mm]
+        self.dtheta = np.full(self.n_targets, np.nan)  # [rad]
+        self.object_x = np.full(self.n_targets, np.nan)
+        self.object_y = np.full(self.n_targets, np.nan)
+
+    def objects(self, world: WorldState, obj_type: str):
+        return world.ball if obj_type == BALL else world.team(obj_type)
+
+    def errors(self, indexes: np.ndarray, x: np.ndarray, y: np.ndarray,
+               theta: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Distance [mm] and orientation error [rad] of every object (columns)
+        to the targets given by indexes (rows)
+        """
+        distance = np.hypot(x[None, :] - self.x[indexes, None],
+                            y[None, :] - self.y[indexes, None])
+        # Same wrapped error as the dtheta shown to the user
+        orientation = np.abs(wrap_angle(self.theta[indexes, None] -
+                                        theta[None, :]))
+        return (distance, orientation)
+
+    @staticmethod
+    def assign(distance: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Targets (rows) and objects (columns) assigned with the minimum total
+        distance
+        """
+        nearest = np.argmin(distance, axis=1)
+        if distance.shape[0] <= distance.shape[1] and \
+                len(np.unique(nearest)) == len(nearest):
+            # Every target has a different nearest object, it is optimal
+            return (np.arange(distance.shape[0]), nearest)
+        return linear_sum_assignment(distance)
+
+    def match(self, world: WorldState, t=None) -> np.ndarray:
+        """
+        Ok flag of each target: the object assigned to it is visible and on
+        the target. The world state is extrapolated to the time t if given
+        """
+        ok = np.zeros(self.n_targets, dtype=bool)
+        self.assigned.fill(NOT_ASSIGNED)
+        for array in (self.dx, self.dy, self.dtheta, self.object_x,
+                      self.object_y):
+            array.fill(np.nan)
+
+        for obj_type, indexes in self.indexes.items():
+            if len(indexes) == 0:
+                continue
+            objects = self.objects(world, obj_type)
+            ids = np.flatnonzero(objects.visible)
+            if len(ids) == 0:
+                continue
+            x, y, theta = (values[ids] for values in objects.positions(t))
+            distance, orientation = self.errors(indexes, x, y, theta)
+
+            rows, cols = self.assign(distance)
+            targets = indexes[rows]
+            in_place = np.round(distance[rows, cols]) <= DISTANCE_THRESHOLD
+            if obj_type != BALL:
+                in_place &= orientation[rows, cols] <= ORIENTATION_THRESHOLD
+            ok[targets] = in_place
+
+            self.assigned[targets] = ids[cols]
+            self.object_x[targets] = x[cols]
+            self.object_y[targets] = y[cols]
+            self.dx[targets] = self.x[targets] - x[cols]
+            self.dy[targets] = self.y[targets] - y[cols]
+            if obj_type != BALL:
+                self.dtheta[targets] = wrap_angle(self.theta[targets] -
+                                                  theta[cols])
+        return ok
+
+    def deviation_rows(self) -> np.ndarray:
+        """
+        [object x, object y, target x, target y] of each assigned target,
+        sent to the UI
+        """
+        assigned = self.assigned != NOT_ASSIGNED
+        return np.column_stack((self.object_x[assigned],
+                                self.object_y[assigned],
+                                self.x[assigned], self.y[assigned]))
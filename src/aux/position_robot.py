@@ -1,13 +1,14 @@
 import json
-import time
 import numpy as np
 
 from enum import Enum
 from tabulate import tabulate
 from os.path import isfile
-from aux.RobotBall import Position, Ball, Robot, BLUE_TEAM, YELLOW_TEAM, BALL,\
-    DISTANCE_THRESHOLD
+from aux.RobotBall import Position, Ball, Robot, BLUE_TEAM, YELLOW_TEAM, BALL
+from aux.world_state import WorldState, ObjectState
+from aux.position_matcher import PositionMatcher, NOT_ASSIGNED
 from aux.utils import red_print, blue_print, green_print, purple_print
+from aux import clock
 
 from aux.hw_challenge_1 import Challenge_1
 from aux.hw_challenge_2 import Challenge_2
@@ -17,6 +18,7 @@ from aux.tc_ball_placement import BallPlacement
 from aux.hw_challenge_fsm import MAX_CHALLENGES
 
 CONFIRMATION_DT = 2  # in seconds
+DEVIATIONS_PRINT_DT = 2  # in seconds, while the objects are being placed
 
 
 class PositionStates(Enum):
@@ -25,6 +27,8 @@ class PositionStates(Enum):
 
 
 class Challenge_Data(Robot):
+    __slots__ = ('ok', 'type')
+
     def __init__(self):
         super().__init__()
         self.ok = False
@@ -33,6 +37,14 @@ class Challenge_Data(Robot):
     def __repr__(self) -> str:
         return '{}/{}/{} = {}'.format(self.type, self.id, self.ok, self.pos)
 
+    def __getstate__(self):
+        return (self.last_seen, self.pos, self.id, self.team, self.ok,
+                self.type)
+
+    def __setstate__(self, state):
+        self.last_seen, self.pos, self.id, self.team, self.ok, \
+            self.type = state
+
     def to_table_format(self) -> []:
         obj = 'Robot {}'.format(self.type)
         if self.type == BALL:
@@ -44,7 +56,7 @@ class Challenge_Data(Robot):
         self.pos = robot.pos
         self.type = robot.team
         self.id = robot.id
-        self.unseen_frames = robot.unseen_frames
+        self.last_seen = robot.last_seen
 
     def from_Ball(self, ball: Ball):
         self.pos = ball.pos
@@ -70,13 +82,31 @@ class PositionFSM(object):
         self.objects_in_place = False
         self.objects_t1 = 0
         self.objects_t2 = 0
+        self.waiting_confirmation = False
+        self.last_deviations_print = clock.now()
 
 # =============================================================================
 
     def challenge_positions_print(self):
+        """
+        Prints the targets with the object assigned to each one and the
+        vector that moves it to the target
+        """
         header = ['Positioned', 'Object', 'ID',
-                  'X [mm]', 'Y [mm]', 'Angle [rad]']
-        data = [line.to_table_format() for line in self.challenge_pos]
+                  'X [mm]', 'Y [mm]', 'Angle [rad]',
+                  'Assigned', 'dX [mm]', 'dY [mm]', 'dAngle [rad]']
+        matcher = self.matcher
+        data = []
+        for n, line in enumerate(self.challenge_pos):
+            row = line.to_table_format()
+            if matcher.assigned[n] == NOT_ASSIGNED:
+                row += ['-', '-', '-', '-']
+            else:
+                dtheta = matcher.dtheta[n]
+                row += [matcher.assigned[n], round(matcher.dx[n]),
+                        round(matcher.dy[n]),
+                        '-' if np.isnan(dtheta) else round(dtheta, 2)]
+            data.append(row)
         blue_print(tabulate(data, header), '\n')
 
 # =============================================================================
@@ -141,57 +171,63 @@ class PositionFSM(object):
             if bot.type == BLUE_TEAM:
                 self.json_blue_id = bot.id
 
+        self.matcher = PositionMatcher(self.challenge_pos)
+        self.positions_ok = np.zeros(len(self.challenge_pos), dtype=bool)
+
         self.challenge_positions_print()
 
 # =============================================================================
 
-    def update_positions(self, blue_robots: [Robot], yellow_robots: [Robot],
-                         ball: Ball):
+    def update_positions(self, world: WorldState, t=None):
+        """
+        Checks the targets against the world state, extrapolated to the time
+        t if given
+        """
         n_pos_ok = self.n_positions_ok()
-        for pos_data in self.challenge_pos:
-            pos_data.ok = False
-            if pos_data.type == BLUE_TEAM:
-                for blue_robot in blue_robots:
-                    if blue_robot.compare(pos_data):
-                        pos_data.ok = True
-
-            elif pos_data.type == YELLOW_TEAM:
-                for yellow_robot in yellow_robots:
-                    if yellow_robot.compare(pos_data):
-                        pos_data.ok = True
-
-            elif pos_data.type == BALL:
-                if ball.compare(pos_data):
-                    pos_data.ok = True
+        self.set_positions_ok(self.matcher.match(world, t))
+        print_deviations = self.state == PositionStates.POSITIONING and \
+            n_pos_ok < len(self.challenge_pos) and \
+            clock.now() - self.last_deviations_print >= DEVIATIONS_PRINT_DT
 
         if self.state == PositionStates.POSITIONING:
-            yellow_not_in_json = self.robot_ids_not_in_json(yellow_robots)
-            blue_not_in_json = self.robot_ids_not_in_json(blue_robots)
-            extra_robots_ok = True
-
-            if yellow_not_in_json > 0:
-                extra_robots_ok = False
-#                  red_print(
-#                      f'[POSITION FSM] There are {yellow_not_in_json} extra yellow robots in the field, please remove them!')
+            self.check_positions_ok(self.extra_robots_ok(world))
 
-            if blue_not_in_json > 0:
-                extra_robots_ok = extra_robots_ok & self.check_extra_robots(blue_robots,
-                                                                            blue_not_in_json,
-                                                                            ball)
-
-            self.check_positions_ok(extra_robots_ok)
-
-        if self.n_positions_ok() > n_pos_ok:
+        if self.n_positions_ok() > n_pos_ok or print_deviations:
+            self.last_deviations_print = clock.now()
             self.challenge_positions_print()
 
+    def extra_robots_ok(self, world: WorldState) -> bool:
+        yellow_robots = world.team(YELLOW_TEAM)
+        blue_robots = world.team(BLUE_TEAM)
+        yellow_not_in_json = self.robot_ids_not_in_json(yellow_robots)
+        blue_not_in_json = self.robot_ids_not_in_json(blue_robots)
+        extra_robots_ok = True
+
+        if yellow_not_in_json > 0:
+            extra_robots_ok = False
+#              red_print(
+#                  f'[POSITION FSM] There are {yellow_not_in_json} extra yellow robots in the field, please remove them!')
+
+        if blue_not_in_json > 0:
+            extra_robots_ok = extra_robots_ok & self.check_extra_robots(blue_robots,
+                                                                        blue_not_in_json)
+        return extra_robots_ok
+
+    def set_positions_ok(self, positions_ok: np.ndarray):
+        # The Challenge_Data sent to the UI only change with the flags
+        if not np.array_equal(positions_ok, self.positions_ok):
+            for pos_data, ok in zip(self.challenge_pos, positions_ok):
+                pos_data.ok = bool(ok)
+        self.positions_ok = positions_ok
+
 # =============================================================================
 
     def n_positions_ok(self) -> int:
-        return np.sum(np.array([data.ok for data in self.challenge_pos]))
+        return int(np.count_nonzero(self.positions_ok))
 
 # =============================================================================
 
-    def check_extra_robots(self, robots: [Robot], robot_ids: int, ball: Ball) -> bool:
+    def check_extra_robots(self, robots: ObjectState, robot_ids: int) -> bool:
         ok = True
         type_of_restriction = ''
         if self.current_challenge != None:
@@ -231,47 +267,81 @@ class PositionFSM(object):
 
     def check_positions_ok(self, extra_robots_ok: bool):
         # All objects are in the correct place
-        if not any(np.invert([data.ok for data in self.challenge_pos])) and extra_robots_ok:
+        if np.all(self.positions_ok) and extra_robots_ok:
             if self.objects_in_place == False:
                 self.objects_in_place = True
-                self.objects_t1 = time.time_ns()
+                self.objects_t1 = clock.now()
                 self.objects_t2 = CONFIRMATION_DT
 
                 green_print('All robots and ball are placed correctly!')
 
             elif self.objects_t2 > 0:
-                self.objects_t2 -= 1e-9*(time.time_ns() - self.objects_t1)
-                self.objects_t1 = time.time_ns()
+                self.objects_t2 -= clock.now() - self.objects_t1
+                self.objects_t1 = clock.now()
 
                 print('Wait {:.2f} seconds'.format(self.objects_t2), end='\r')
 
-            elif self.objects_in_place and self.objects_t2 <= 0:
-                self.state = PositionStates.POSITIONED
-
+            elif self.objects_in_place and not self.waiting_confirmation:
+                # The vision keeps being processed until confirm() is called
+                self.waiting_confirmation = True
                 green_print(
-                    'Starting the challenge, press Enter to continue...')
-                input()
-
-                if self.object_positioned_callback != None:
-                    self.object_positioned_callback()
+                    'Starting the challenge, press Enter (console or UI) to continue...')
 
         elif self.objects_in_place == True:
+            if self.waiting_confirmation:
+                red_print('[POSITION FSM] The objects moved, place them again!')
             self.objects_in_place = False
+            self.waiting_confirmation = False
             self.objects_t1 = 0
             self.objects_t1 = 0
 
+    def confirm(self, world: WorldState, t=None) -> bool:
+        """
+        Starts the challenge if the objects are still in place, they are
+        checked again against the world state at the moment of the
+        confirmation. Returns True if the challenge started
+        """
+        if self.state != PositionStates.POSITIONING:
+            return False
+        if not self.waiting_confirmation:
+            red_print('[POSITION FSM] The objects are not in place yet!')
+            return False
+
+        self.set_positions_ok(self.matcher.match(world, t))
+        if not (np.all(self.positions_ok) and self.extra_robots_ok(world)):
+            red_print('[POSITION FSM] The objects are not in place anymore!')
+            self.objects_in_place = False
+            self.waiting_confirmation = False
+            self.challenge_positions_print()
+            return False
+
+        self.state = PositionStates.POSITIONED
+        self.waiting_confirmation = False
+        if self.object_positioned_callback != None:
+            self.object_positioned_callback()
+        return True
+
 # =============================================================================
 
     def get_challenge_positions(self) -> [Challenge_Data]:
         return self.challenge_pos
 
+    def get_deviations(self) -> np.ndarray:
+        """
+        [object x, object y, target x, target y] of the assigned targets while
+        the objects are being placed
+        """
+        if self.state != PositionStates.POSITIONING:
+            return np.empty((0, 4))
+        return self.matcher.deviation_rows()
+
 # =============================================================================
 
-    def robot_ids_not_in_json(self, robots: [Robot]) -> int:
+    def robot_ids_not_in_json(self, robots: ObjectState) -> int:
         challenge_ids = len([data.id for data in self.challenge_pos
-                             if data.type == robots[0].team])
+                             if data.type == robots.team])
 
-        ids_not_json = len([robot.id for robot in robots if robot.in_vision()])
+        ids_not_json = robots.n_visible()
 
         return ids_not_json - challenge_ids
 
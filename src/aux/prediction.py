@@ -0,0 +1,95 @@
+import numpy as np
+
+# Objects are extrapolated at most this far, it bounds the error of a stale
+# velocity when the vision stops
+MAX_PREDICTION_TIME = 0.2  # in seconds
+MAX_VELOCITY_DT = 0.2  # in seconds, older samples restart the estimate
+VELOCITY_SMOOTHING = 0.5  # weight of the newest finite difference
+# Smaller velocities are vision noise of a still object and are reported as
+# 0, otherwise the extrapolation moves it by a good part of the thresholds
+VELOCITY_NOISE_FLOOR = 150.0  # in mm/s
+ANGULAR_NOISE_FLOOR = 0.5  # in rad/s
+N_TEAM_CODES = 3  # blue, yellow and ball, see aux.detection_array
+MAX_ID = 256
+
+
+def wrap_angle(angle):
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+def prediction_times(t: float, t_local: np.ndarray) -> np.ndarray:
+    """
+    Seconds from the capture of each object to t, both in
+    aux.clock.monotonic() time (see the t_local column of
+    aux.detection_array), limited to [0, MAX_PREDICTION_TIME] (0 for the
+    objects never seen or with an unknown receive time)
+    """
+    return np.where(t_local > 0,
+                    np.clip(t - t_local, 0.0, MAX_PREDICTION_TIME), 0.0)
+
+
+class VelocityEstimator(object):
+    """
+    Cheap velocity of raw vision detections: smoothed finite differences
+    between consecutive frames, kept in a table indexed by team and id.
+    The velocities under the noise floors are reported as 0
+    """
+
+    def __init__(self, smoothing=VELOCITY_SMOOTHING, max_dt=MAX_VELOCITY_DT,
+                 noise_floor=VELOCITY_NOISE_FLOOR,
+                 angular_noise_floor=ANGULAR_NOISE_FLOOR):
+        self.smoothing = smoothing
+        self.max_dt = max_dt
+        self.noise_floor = noise_floor
+        self.angular_noise_floor = angular_noise_floor
+        size = N_TEAM_CODES * MAX_ID
+        self.x = np.zeros(size)
+        self.y = np.zeros(size)
+        self.theta = np.zeros(size)
+        self.t_capture = np.zeros(size)
+        self.vx = np.zeros(size)
+        self.vy = np.zeros(size)
+        self.omega = np.zeros(size)
+
+    def estimate(self, rows: np.ndarray):
+        """
+        Fills the vx, vy and omega columns of the rows in place
+        """
+        if len(rows) == 0:
+            return
+
+        index = rows['team'].astype(np.intp) * MAX_ID + rows['id']
+        dt = rows['t_capture'] - self.t_capture[index]
+        new = dt > 0
+        valid = new & (self.t_capture[index] > 0) & (dt <= self.max_dt)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vx = (rows['x'] - self.x[index]) / dt
+            vy = (rows['y'] - self.y[index]) / dt
+            omega = wrap_angle(rows['theta'] - self.theta[index]) / dt
+
+        # Only the objects with a new sample change their velocity, a restart
+        # (first sample or a long gap) sets it to 0
+        a = self.smoothing
+        self.vx[index] = np.where(valid, a * vx + (1 - a) * self.vx[index],
+                                  np.where(new, 0.0, self.vx[index]))
+        self.vy[index] = np.where(valid, a * vy + (1 - a) * self.vy[index],
+                                  np.where(new, 0.0, self.vy[index]))
+        self.omega[index] = np.where(valid,
+                                     a * omega + (1 - a) * self.omega[index],
+                                     np.where(new, 0.0, self.omega[index]))
+
+        self.x[index] = np.where(new, rows['x'], self.x[index])
+        self.y[index] = np.where(new, rows['y'], self.y[index])
+        self.theta[index] = np.where(new, rows['theta'], self.theta[index])
+        self.t_capture[index] = np.where(new, rows['t_capture'],
+                                         self.t_capture[index])
+
+        # The smoothed state keeps the small values, so a slow object still
+        # builds up its velocity
+        moving = np.hypot(self.vx[index], self.vy[index]) >= self.noise_floor
+        rows['vx'] = np.where(moving, self.vx[index], 0.0)
+        rows['vy'] = np.where(moving, self.vy[index], 0.0)
+        rows['omega'] = np.where(
+            np.abs(self.omega[index]) >= self.angular_noise_floor,
+            self.omega[index], 0.0)
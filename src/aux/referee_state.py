@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+
+class TeamInfo(object):
+    def __init__(self, name='', score=0, red_cards=0, yellow_cards=0,
+                 timeouts=0, timeout_time=0, goalie=0):
+        self.name = name
+        self.score = score
+        self.red_cards = red_cards
+        self.yellow_cards = yellow_cards
+        self.timeouts = timeouts
+        self.timeout_time = timeout_time  # in microseconds
+        self.goalie = goalie
+
+    def __repr__(self):
+        return '{} ({})'.format(self.name, self.score)
+
+
+class RefereeState(object):
+    """
+    State of the game according to the last SSL_Referee packet
+    """
+
+    def __init__(self, stage='', command='', command_counter=-1,
+                 command_timestamp=0, packet_timestamp=0, stage_time_left=0,
+                 designated_position=None, yellow=None, blue=None):
+        self.stage = stage
+        self.command = command
+        self.command_counter = command_counter
+        self.command_timestamp = command_timestamp  # in microseconds
+        self.packet_timestamp = packet_timestamp  # in microseconds
+        self.stage_time_left = stage_time_left  # in microseconds
+        self.designated_position = designated_position  # [x, y] in mm
+        self.yellow = yellow if yellow != None else TeamInfo()
+        self.blue = blue if blue != None else TeamInfo()
+
+    def __repr__(self):
+        return '{} | {} #{}'.format(self.stage, self.command,
+                                    self.command_counter)
+
+# =============================================================================
+
+
+class RefereeEvent(object):
+    """
+    Emitted when the referee command (command_counter) or the stage changes
+    """
+
+    def __init__(self, state: RefereeState, previous_state: RefereeState):
+        if previous_state == None:
+            previous_state = RefereeState()
+
+        self.state = state
+        self.previous_state = previous_state
+        self.command_changed = state.command_counter != previous_state.command_counter
+        self.stage_changed = state.stage != previous_state.stage
+
+    def __repr__(self):
+        return 'Referee {} -> {}'.format(self.previous_state, self.state)
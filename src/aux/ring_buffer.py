@@ -0,0 +1,80 @@
+import time
+from threading import Lock
+
+
+class RingBuffer(object):
+    """
+    Fixed size, thread safe buffer of raw datagrams. When it is full the
+    oldest datagram is overwritten and counted as an overrun
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = Lock()
+        self.packets = [None] * size
+        self.rx_times = [0.0] * size
+        self.head = 0  # next slot to be read
+        self.count = 0
+
+        # Counters
+        self.received = 0
+        self.consumed = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_lag = 0.0  # in seconds
+        self.max_lag = 0.0
+        self.last_rx_time = 0.0  # of the last datagram returned
+
+    def push(self, packet: bytes, rx_time: float):
+        with self.lock:
+            tail = (self.head + self.count) % self.size
+            self.packets[tail] = packet
+            self.rx_times[tail] = rx_time
+            self.received += 1
+
+            if self.count == self.size:
+                self.head = (self.head + 1) % self.size
+                self.overruns += 1
+            else:
+                self.count += 1
+
+    def pop(self):
+        with self.lock:
+            if self.count == 0:
+                return None
+            return self.take(self.head)
+
+    def pop_latest(self):
+        """
+        Returns the newest datagram, discarding the older ones
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            self.skipped += self.count - 1
+            self.head = (self.head + self.count - 1) % self.size
+            self.count = 1
+            return self.take(self.head)
+
+    def take(self, slot: int):
+        packet = self.packets[slot]
+        self.packets[slot] = None
+        self.head = (slot + 1) % self.size
+        self.count -= 1
+        self.consumed += 1
+
+        self.last_rx_time = self.rx_times[slot]
+        self.last_lag = time.monotonic() - self.last_rx_time
+        self.max_lag = max(self.max_lag, self.last_lag)
+        return packet
+
+    def has_data(self) -> bool:
+        return self.count > 0
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {'received': self.received, 'consumed': self.consumed,
+                    'pending': self.count, 'overruns': self.overruns,
+                    'skipped': self.skipped,
+                    'last_lag_ms': 1e3 * self.last_lag,
+                    'max_lag_ms': 1e3 * self.max_lag}
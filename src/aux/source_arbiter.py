@@ -0,0 +1,77 @@
+import time
+
+DEFAULT_STALENESS = 0.5  # in seconds without frames
+
+
+class SourceSwitchEvent(object):
+    """
+    Emitted when the arbiter starts trusting another source, source is None
+    when every source is stale
+    """
+
+    def __init__(self, previous_source: str, source: str, t: float,
+                 frame_age: float):
+        self.previous_source = previous_source
+        self.source = source
+        self.t = t
+        # Time since the last frame of the previous source
+        self.frame_age = frame_age
+
+    def __repr__(self):
+        age = '' if self.frame_age == None else \
+            ' (last frame {:.2f} s ago)'.format(self.frame_age)
+        return 'Vision source {} -> {}{}'.format(self.previous_source,
+                                                 self.source, age)
+
+
+class SourceArbiter(object):
+    """
+    Chooses the vision source to trust: the first one in the priority list
+    whose last frame is within its staleness deadline. The deadlines are in
+    monotonic time, so the choice doesn't depend on how fast the loop runs
+    """
+
+    def __init__(self, priority: [str], staleness=None,
+                 time_source=time.monotonic):
+        if staleness == None:
+            staleness = dict()
+        self.priority = list(priority)
+        self.staleness = {source: staleness.get(source, DEFAULT_STALENESS)
+                          for source in self.priority}
+        self.time_source = time_source
+        self.last_frame = {source: None for source in self.priority}
+        self.source = None
+        self.events = []
+
+    def frame_received(self, source: str):
+        if source in self.last_frame:
+            self.last_frame[source] = self.time_source()
+
+    def frame_age(self, source: str, now: float) -> float:
+        last_frame = self.last_frame.get(source)
+        if last_frame == None:
+            return None
+        return now - last_frame
+
+    def is_fresh(self, source: str, now: float) -> bool:
+        age = self.frame_age(source, now)
+        return age != None and age <= self.staleness[source]
+
+    def select(self) -> str:
+        """
+        Returns the source to use now (None if every source is stale)
+        """
+        now = self.time_source()
+        source = next((source for source in self.priority
+                       if self.is_fresh(source, now)), None)
+
+        if source != self.source:
+            self.events.append(SourceSwitchEvent(
+                self.source, source, now, self.frame_age(self.source, now)))
+            self.source = source
+        return source
+
+    def pop_events(self) -> [SourceSwitchEvent]:
+        events = self.events
+        self.events = []
+        return events
@@ -0,0 +1,39 @@
+import sys
+
+from multiprocessing import Pipe
+from threading import Thread
+
+CONFIRM_EVENT = 'CONFIRM'
+
+
+class StdinReader(object):
+    """
+    Reads the console in a daemon thread and sends a CONFIRM_EVENT for each
+    line (Enter), through a pipe that can be waited on together with the UDP
+    sockets, so the main loop never blocks on input()
+    """
+
+    def __init__(self, stream=None):
+        self.stream = sys.stdin if stream == None else stream
+        self.receiver, self.sender = Pipe(duplex=False)
+        self.thread = Thread(target=self.read_lines, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def read_lines(self):
+        try:
+            # readline returns '' at the end of the stream
+            for _ in iter(self.stream.readline, ''):
+                self.sender.send(CONFIRM_EVENT)
+        except (OSError, ValueError):
+            # The stream was closed
+            pass
+
+    def get_event(self) -> str:
+        if self.receiver.poll():
+            return self.receiver.recv()
+        return None
+
+    def get_fileobj(self):
+        return self.receiver
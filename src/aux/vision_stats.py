@@ -0,0 +1,149 @@
+import json
+import numpy as np
+from tabulate import tabulate
+
+from aux.utils import red_print, blue_print, green_print, purple_print
+from aux import clock
+
+ROLLING_WINDOW = 1000  # samples kept per histogram
+HISTOGRAM_BINS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]  # [ms]
+
+
+class RollingHistogram(object):
+    """
+    Keeps the last `size` samples in a preallocated array, the statistics
+    are only computed when requested
+    """
+
+    def __init__(self, size=ROLLING_WINDOW):
+        self.samples = np.zeros(size)
+        self.index = 0
+        self.n_samples = 0
+
+    def add(self, value: float):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        self.n_samples = min(self.n_samples + 1, len(self.samples))
+
+    def values(self) -> np.array:
+        return self.samples[:self.n_samples]
+
+    def summary(self) -> dict:
+        if self.n_samples == 0:
+            return {'n': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0,
+                    'max': 0.0}
+
+        values = self.values()
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {'n': int(self.n_samples), 'mean': float(np.mean(values)),
+                'p50': float(p50), 'p95': float(p95), 'p99': float(p99),
+                'max': float(np.max(values))}
+
+    def histogram(self, bins=HISTOGRAM_BINS) -> [int]:
+        counts, _ = np.histogram(self.values(), bins=bins + [np.inf])
+        return counts.tolist()
+
+# =============================================================================
+
+
+class CameraStats(object):
+    def __init__(self, camera_id: int):
+        self.camera_id = camera_id
+        self.frames = 0
+        self.lost_frames = 0
+        self.last_frame_number = None
+
+        # All in ms
+        self.capture_to_send = RollingHistogram()
+        self.send_to_receive = RollingHistogram()
+        self.processing = RollingHistogram()
+
+    def add_frame(self, frame_number: int, t_capture: float, t_sent: float,
+                  rx_time: float):
+        if self.last_frame_number != None:
+            gap = frame_number - self.last_frame_number - 1
+            # A negative gap means SSL-Vision was restarted
+            if gap > 0:
+                self.lost_frames += gap
+        self.last_frame_number = frame_number
+        self.frames += 1
+
+        self.capture_to_send.add(1e3 * (t_sent - t_capture))
+        self.send_to_receive.add(1e3 * (rx_time - t_sent))
+
+    def loss(self) -> float:
+        total = self.frames + self.lost_frames
+        if total == 0:
+            return 0.0
+        return self.lost_frames / total
+
+# =============================================================================
+
+
+class VisionStats(object):
+    """
+    Per camera frame loss and latency: capture -> send (SSL-Vision),
+    send -> receive (network, assumes synchronized clocks) and receive ->
+    end of update_vision_data (this tool)
+    """
+
+    def __init__(self):
+        self.cameras = dict()
+        self.pending = []  # (camera id, monotonic receive time)
+
+    def add_frame(self, frame, rx_time: float, rx_monotonic: float):
+        """
+        rx_time is the wall clock (the log time in a replay) and rx_monotonic
+        the aux.clock.monotonic() time when the packet was received
+        """
+        camera = self.cameras.get(frame.camera_id)
+        if camera == None:
+            camera = CameraStats(frame.camera_id)
+            self.cameras[frame.camera_id] = camera
+
+        camera.add_frame(frame.frame_number, frame.t_capture, frame.t_sent,
+                         rx_time)
+        self.pending.append((frame.camera_id, rx_monotonic))
+
+    def processing_done(self):
+        now = clock.monotonic()
+        for camera_id, rx_monotonic in self.pending:
+            self.cameras[camera_id].processing.add(1e3 * (now - rx_monotonic))
+        self.pending = []
+
+# =============================================================================
+
+    def to_dict(self) -> dict:
+        return {str(camera_id): {'frames': camera.frames,
+                                 'lost_frames': camera.lost_frames,
+                                 'capture_to_send_ms': camera.capture_to_send.summary(),
+                                 'send_to_receive_ms': camera.send_to_receive.summary(),
+                                 'processing_ms': camera.processing.summary(),
+                                 'processing_histogram': camera.processing.histogram()}
+                for camera_id, camera in sorted(self.cameras.items())}
+
+    def print_stats(self):
+        header = ['Camera', 'Frames', 'Lost [%]',
+                  'Capture->Send p50/p95 [ms]', 'Send->Receive p50/p95 [ms]',
+                  'Processing p50/p95 [ms]']
+        data = []
+        for camera_id, camera in sorted(self.cameras.items()):
+            latencies = [histogram.summary() for histogram in
+                         (camera.capture_to_send, camera.send_to_receive,
+                          camera.processing)]
+            data.append([camera_id, camera.frames, 100 * camera.loss()] +
+                        ['{:.2f}/{:.2f}'.format(latency['p50'], latency['p95'])
+                         for latency in latencies])
+        blue_print(tabulate(data, header, floatfmt='.2f'), '\n')
+
+    def export(self, filename: str, socket_stats=None):
+        data = self.to_dict()
+        data['histogram_bins_ms'] = HISTOGRAM_BINS
+        if socket_stats != None:
+            data['sockets'] = socket_stats
+        try:
+            with open(filename, 'w') as stats_file:
+                json.dump(data, stats_file, indent=4)
+            green_print(f'[STATS] Vision statistics saved to {filename}')
+        except OSError as except_type:
+            red_print('[STATS] Failed to save vision statistics:', except_type)
@@ -0,0 +1,181 @@
+import numpy as np
+
+from aux.RobotBall import Robot, Ball, Position, BLUE_TEAM, YELLOW_TEAM, BALL, \
+    INF, NEVER_SEEN, VISIBILITY_TIMEOUT
+from aux.detection_array import BLUE_CODE, YELLOW_CODE, BALL_CODE
+from aux.prediction import prediction_times, wrap_angle
+from aux import clock
+
+
+class ObjectState(object):
+    """
+    State of a group of objects (one team or the ball) in arrays indexed by
+    id: x, y in mm, theta in rad, the velocity and the monotonic time (see
+    aux.clock) when each object was last seen. The visibility is computed
+    when it is queried, so it doesn't depend on the frame rate
+    """
+
+    def __init__(self, team: str, size: int, timeout=VISIBILITY_TIMEOUT,
+                 time_source=clock.monotonic):
+        self.team = team
+        self.timeout = timeout  # [s] without detections before leaving
+        self.time_source = time_source
+        self.x = np.full(size, INF, dtype=np.float64)
+        self.y = np.full(size, INF, dtype=np.float64)
+        self.theta = np.zeros(size)
+        self.vx = np.zeros(size)  # [mm/s]
+        self.vy = np.zeros(size)  # [mm/s]
+        self.omega = np.zeros(size)  # [rad/s]
+        self.t_capture = np.zeros(size)  # vision time of the last detection
+        self.t_local = np.zeros(size)  # the same in aux.clock.monotonic time
+        self.last_seen = np.full(size, NEVER_SEEN, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.x)
+
+    def set_rows(self, ids: np.ndarray, rows: np.ndarray, now: float):
+        self.x[ids] = rows['x']
+        self.y[ids] = rows['y']
+        self.theta[ids] = rows['theta']
+        self.vx[ids] = rows['vx']
+        self.vy[ids] = rows['vy']
+        self.omega[ids] = rows['omega']
+        self.t_capture[ids] = rows['t_capture']
+        self.t_local[ids] = rows['t_local']
+        self.last_seen[ids] = now
+
+    @property
+    def visible(self) -> np.ndarray:
+        return self.time_source() - self.last_seen <= self.timeout
+
+    def is_visible(self, index: int) -> bool:
+        return self.time_source() - self.last_seen[index] <= self.timeout
+
+    def n_visible(self) -> int:
+        return int(np.count_nonzero(self.visible))
+
+    def positions(self, t=None) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        x, y and theta of every object, extrapolated with the velocity to the
+        time t if given (see aux.prediction)
+        """
+        if t == None:
+            return (self.x, self.y, self.theta)
+        dt = prediction_times(t, self.t_local)
+        return (self.x + self.vx * dt, self.y + self.vy * dt,
+                wrap_angle(self.theta + self.omega * dt))
+
+    def visible_rows(self) -> np.ndarray:
+        """
+        [id, x, y, theta] of the visible objects, sent to the UI
+        """
+        ids = np.flatnonzero(self.visible)
+        return np.column_stack((ids, self.x[ids], self.y[ids],
+                                self.theta[ids]))
+
+# =============================================================================
+
+
+class WorldState(object):
+    """
+    Robots of both teams and the ball, updated with the rows of one frame
+    (aux.detection_array.DETECTION_DTYPE) at a time
+    """
+
+    def __init__(self, max_robots: int, visibility_timeout=VISIBILITY_TIMEOUT,
+                 time_source=clock.monotonic):
+        self.max_robots = max_robots
+        self.time_source = time_source
+        self.teams = {team: ObjectState(team, max_robots, visibility_timeout,
+                                        time_source)
+                      for team in (BLUE_TEAM, YELLOW_TEAM)}
+        self.team_codes = {BLUE_CODE: self.teams[BLUE_TEAM],
+                           YELLOW_CODE: self.teams[YELLOW_TEAM]}
+        self.ball = ObjectState(BALL, 1, visibility_timeout, time_source)
+        self.ball_in_frame = False
+
+    def team(self, team: str) -> ObjectState:
+        return self.teams[team]
+
+    def update(self, rows: np.ndarray):
+        now = self.time_source()
+        for code, state in self.team_codes.items():
+            team_rows = rows[(rows['team'] == code) &
+                             (rows['id'] < self.max_robots)]
+            state.set_rows(team_rows['id'], team_rows, now)
+
+        balls = rows[rows['team'] == BALL_CODE]
+        if len(balls) > 0:
+            self.ball.x[0] = balls['x'].mean()
+            self.ball.y[0] = balls['y'].mean()
+            self.ball.vx[0] = balls['vx'].mean()
+            self.ball.vy[0] = balls['vy'].mean()
+            self.ball.t_capture[0] = balls['t_capture'].max()
+            self.ball.t_local[0] = balls['t_local'].max()
+            self.ball.last_seen[0] = now
+        self.ball_in_frame = len(balls) > 0
+
+    def ball_detected(self) -> bool:
+        """
+        True if the ball was in the last frame
+        """
+        return self.ball_in_frame
+
+    def position(self, team: str, robot_id: int, t=None) -> Position:
+        state = self.ball if team == BALL else self.teams[team]
+        x, y, theta = state.positions(t)
+        return Position(float(x[robot_id]), float(y[robot_id]),
+                        theta[robot_id])
+
+    def robots(self, team: str) -> [Robot]:
+        return [RobotView(self, team, robot_id)
+                for robot_id in range(self.max_robots)]
+
+# =============================================================================
+
+
+class RobotView(Robot):
+    """
+    Read-only Robot over one row of the world state, for the code that still
+    uses the Robot API
+    """
+    __slots__ = ('world', 'state')
+
+    def __init__(self, world: WorldState, team: str, robot_id: int):
+        self.world = world
+        self.state = world.team(team)
+        self.team = team
+        self.id = robot_id
+
+    @property
+    def pos(self) -> Position:
+        return self.world.position(self.team, self.id)
+
+    @property
+    def last_seen(self) -> float:
+        return float(self.state.last_seen[self.id])
+
+    def in_vision(self) -> bool:
+        return bool(self.state.is_visible(self.id))
+
+
+class BallView(Ball):
+    """
+    Read-only Ball over the world state
+    """
+    __slots__ = ('world', 'state')
+
+    def __init__(self, world: WorldState):
+        self.world = world
+        self.state = world.ball
+
+    @property
+    def pos(self) -> Position:
+        return self.world.position(BALL, 0)
+
+    @property
+    def last_seen(self) -> float:
+        return float(self.state.last_seen[0])
+
+    def in_vision(self) -> bool:
+        return bool(self.state.is_visible(0))
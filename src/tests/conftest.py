@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported like the scripts in src do (e.g. aux.packet_log)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
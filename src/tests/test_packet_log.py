@@ -0,0 +1,59 @@
+import os
+import struct
+import pytest
+
+from aux.packet_log import PacketLogWriter, PacketLogReader, open_log, \
+    index_filename, VISION_LOG_ID, REFEREE_LOG_ID, RECORD_HEADER
+
+PACKETS = [(VISION_LOG_ID, 10.0, b'vision 1'),
+           (REFEREE_LOG_ID, 10.5, b'referee'),
+           (VISION_LOG_ID, 11.25, b'vision 2 is a bit longer')]
+
+
+def write_log(filename: str):
+    writer = PacketLogWriter(str(filename))
+    start = writer.start_monotonic
+    for source_id, t, packet in PACKETS:
+        writer.write(source_id, start + t, packet)
+    writer.close()
+    return writer
+
+
+def read_all(reader) -> list:
+    return [(source_id, rx_time, bytes(packet))
+            for source_id, rx_time, packet in reader.records()]
+
+
+def test_round_trip(tmp_path):
+    filename = tmp_path / 'test.log'
+    writer = write_log(filename)
+
+    reader = open_log(str(filename))
+    assert isinstance(reader, PacketLogReader)
+    records = read_all(reader)
+    reader.close()
+
+    assert [(source_id, packet) for source_id, _, packet in records] == \
+        [(source_id, packet) for source_id, _, packet in PACKETS]
+    for (_, rx_time, _), (_, t, _) in zip(records, PACKETS):
+        assert rx_time == pytest.approx(writer.start_time + t)
+
+
+def test_truncated_last_record(tmp_path):
+    filename = tmp_path / 'test.log'
+    write_log(filename)
+    # A recording killed while writing the last record
+    size = os.path.getsize(filename)
+    with open(filename, 'r+b') as log_file:
+        log_file.truncate(size - 5)
+    os.remove(index_filename(str(filename)))
+
+    reader = open_log(str(filename))
+    records = read_all(reader)
+    assert [packet for _, _, packet in records] == \
+        [packet for _, _, packet in PACKETS[:-1]]
+
+    last_offset = size - RECORD_HEADER.size - len(PACKETS[-1][2])
+    with pytest.raises(struct.error):
+        reader.read_record(last_offset)
+    reader.close()
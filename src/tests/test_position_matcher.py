@@ -0,0 +1,99 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from aux.assignment import linear_sum_assignment
+from aux.position_matcher import PositionMatcher, NOT_ASSIGNED
+from aux.detection_array import DetectionArray, BLUE_CODE
+from aux.world_state import WorldState
+from aux.RobotBall import BLUE_TEAM
+
+
+def brute_force_cost(cost: np.ndarray) -> float:
+    n_rows, n_cols = cost.shape
+    if n_rows <= n_cols:
+        return min(cost[np.arange(n_rows), list(cols)].sum()
+                   for cols in itertools.permutations(range(n_cols), n_rows))
+    return brute_force_cost(cost.T)
+
+
+def test_known_assignment():
+    cost = np.array([[4, 1, 3],
+                     [2, 0, 5],
+                     [3, 2, 2]])
+    rows, cols = linear_sum_assignment(cost)
+    assert list(rows) == [0, 1, 2]
+    assert list(cols) == [1, 0, 2]
+
+
+@pytest.mark.parametrize('shape', [(3, 5), (5, 3), (1, 4), (4, 1), (6, 6)])
+def test_rectangular_is_optimal(shape):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        cost = rng.integers(0, 20, size=shape).astype(np.float64)
+        rows, cols = linear_sum_assignment(cost)
+        assert len(rows) == min(shape)
+        assert list(rows) == sorted(rows)
+        assert len(set(rows)) == len(rows) and len(set(cols)) == len(cols)
+        assert cost[rows, cols].sum() == brute_force_cost(cost)
+
+
+def test_empty_and_invalid():
+    rows, cols = linear_sum_assignment(np.zeros((0, 3)))
+    assert len(rows) == 0 and len(cols) == 0
+    with pytest.raises(ValueError):
+        linear_sum_assignment(np.zeros(3))
+    with pytest.raises(ValueError):
+        linear_sum_assignment(np.array([[1.0, np.inf]]))
+
+
+def target(x: float, y: float, theta=0.0, obj_type=BLUE_TEAM):
+    return SimpleNamespace(pos=SimpleNamespace(x=x, y=y, orientation=theta),
+                           type=obj_type)
+
+
+def make_world(robots: list) -> WorldState:
+    """
+    robots are (id, x, y, theta) of the blue team
+    """
+    world = WorldState(8)
+    detections = DetectionArray()
+    for robot_id, x, y, theta in robots:
+        detections.append(BLUE_CODE, robot_id, x, y, theta, 1.0, 0, 1.0)
+    world.update(detections.rows())
+    return world
+
+
+def test_one_robot_per_target():
+    # Robot 0 is the nearest to both targets, the total distance is minimal
+    # when it takes the second one
+    matcher = PositionMatcher([target(0, 0), target(100, 0)])
+    world = make_world([(0, 90, 0, 0), (5, -20, 0, 0)])
+    ok = matcher.match(world)
+
+    assert list(matcher.assigned) == [5, 0]
+    assert list(ok) == [True, True]
+    assert list(matcher.dx) == pytest.approx([20, 10])
+
+
+def test_more_targets_than_robots():
+    matcher = PositionMatcher([target(0, 0), target(1000, 0), target(0, 10)])
+    world = make_world([(2, 0, 8, 0)])
+    ok = matcher.match(world)
+
+    assert list(matcher.assigned) == [NOT_ASSIGNED, NOT_ASSIGNED, 2]
+    assert list(ok) == [False, False, True]
+    assert np.isnan(matcher.dx[0]) and np.isnan(matcher.dx[1])
+    assert matcher.deviation_rows().tolist() == [[0, 8, 0, 10]]
+
+
+def test_orientation_sign():
+    matcher = PositionMatcher([target(0, 0, 0.5), target(500, 0, np.pi - 0.05)])
+    world = make_world([(0, 0, 0, -0.5), (1, 500, 0, -np.pi + 0.05)])
+    ok = matcher.match(world)
+
+    # A mirrored orientation is not on the target, across pi it is
+    assert list(ok) == [False, True]
+    assert list(matcher.dtheta) == pytest.approx([1.0, -0.1])
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+import ssl_vision_detection_pb2 as detection
+
+from ProcessUDPData import VisionFusion, CAMERA_TIMEOUT
+from aux.detection_array import BLUE_CODE, YELLOW_CODE, BALL_CODE, NO_CAMERA
+from aux.world_state import WorldState
+from aux.RobotBall import BLUE_TEAM, YELLOW_TEAM
+
+
+def make_frame(camera_id: int, t_capture: float, balls=(), blue=(),
+               yellow=()) -> detection.SSL_DetectionFrame:
+    """
+    balls are (x, y, confidence), robots (id, x, y, theta, confidence)
+    """
+    frame = detection.SSL_DetectionFrame(frame_number=1, t_capture=t_capture,
+                                         t_sent=t_capture + 0.001,
+                                         camera_id=camera_id)
+    for x, y, confidence in balls:
+        frame.balls.add(x=x, y=y, confidence=confidence, pixel_x=0, pixel_y=0)
+    for robots, team in ((blue, frame.robots_blue),
+                         (yellow, frame.robots_yellow)):
+        for robot_id, x, y, theta, confidence in robots:
+            team.add(robot_id=robot_id, x=x, y=y, orientation=theta,
+                     confidence=confidence, pixel_x=0, pixel_y=0)
+    return frame
+
+
+def find(rows: np.ndarray, team: int, robot_id: int) -> np.ndarray:
+    row = rows[(rows['team'] == team) & (rows['id'] == robot_id)]
+    assert len(row) == 1
+    return row[0]
+
+
+def test_weighted_merge_of_two_cameras():
+    fusion = VisionFusion()
+    fusion.add_frame(make_frame(0, 10.0, balls=[(100, 0, 0.25)],
+                                blue=[(3, 0, 0, 0.1, 0.25)]))
+    fusion.add_frame(make_frame(1, 10.01, balls=[(200, 40, 0.75)],
+                                blue=[(3, 400, 100, 0.3, 0.75)],
+                                yellow=[(3, -500, 0, 0.0, 0.5)]))
+    rows = fusion.fuse()
+
+    assert len(rows) == 3
+    ball = find(rows, BALL_CODE, 0)
+    assert ball['x'] == pytest.approx(175)
+    assert ball['y'] == pytest.approx(30)
+    assert ball['camera'] == NO_CAMERA
+    assert ball['t_capture'] == pytest.approx(10.01)
+
+    # The same id in both teams are different robots
+    blue = find(rows, BLUE_CODE, 3)
+    assert blue['x'] == pytest.approx(300)
+    assert blue['y'] == pytest.approx(75)
+    assert blue['theta'] == pytest.approx(0.25, abs=1e-3)
+    assert blue['confidence'] == pytest.approx(0.75)
+    assert blue['camera'] == NO_CAMERA
+
+    yellow = find(rows, YELLOW_CODE, 3)
+    assert yellow['x'] == pytest.approx(-500)
+    assert yellow['camera'] == 1
+
+
+def test_orientation_average_across_pi():
+    fusion = VisionFusion()
+    fusion.add_frame(make_frame(0, 10.0, blue=[(0, 0, 0, np.pi - 0.1, 1)]))
+    fusion.add_frame(make_frame(1, 10.0, blue=[(0, 0, 0, -np.pi + 0.1, 1)]))
+    theta = find(fusion.fuse(), BLUE_CODE, 0)['theta']
+    assert abs(theta) == pytest.approx(np.pi, abs=1e-6)
+
+
+def test_old_frames_are_ignored():
+    fusion = VisionFusion()
+    assert fusion.add_frame(make_frame(0, 10.0, blue=[(0, 100, 0, 0, 1)]))
+    assert not fusion.add_frame(make_frame(0, 9.9, blue=[(0, 900, 0, 0, 1)]))
+    assert find(fusion.fuse(), BLUE_CODE, 0)['x'] == pytest.approx(100)
+
+
+def test_camera_timeout():
+    fusion = VisionFusion()
+    fusion.add_frame(make_frame(0, 10.0, blue=[(0, 100, 0, 0, 1)]))
+    fusion.add_frame(make_frame(1, 10.0 + CAMERA_TIMEOUT,
+                                blue=[(1, 200, 0, 0, 1)]))
+    assert len(fusion.fuse()) == 2
+
+    # The vision time of the newest camera decides, not the local clock
+    fusion.add_frame(make_frame(1, 10.1 + CAMERA_TIMEOUT,
+                                blue=[(1, 200, 0, 0, 1)]))
+    rows = fusion.fuse()
+    assert list(rows['id']) == [1]
+    assert list(fusion.camera_frames) == [1]
+
+
+def test_world_state_update():
+    now = [100.0]
+    world = WorldState(4, visibility_timeout=1.0, time_source=lambda: now[0])
+    fusion = VisionFusion()
+    fusion.add_frame(make_frame(0, 10.0, balls=[(100, 0, 1), (300, 20, 1)],
+                                blue=[(1, 10, 20, 0.5, 1),
+                                      (7, 0, 0, 0, 1)],
+                                yellow=[(2, -10, -20, -0.5, 1)]))
+    world.update(fusion.fuse())
+
+    blue, yellow = world.team(BLUE_TEAM), world.team(YELLOW_TEAM)
+    # The ids over max_robots are dropped
+    assert list(np.flatnonzero(blue.visible)) == [1]
+    assert list(np.flatnonzero(yellow.visible)) == [2]
+    assert (blue.x[1], blue.y[1], blue.theta[1]) == \
+        pytest.approx((10, 20, 0.5))
+    assert (yellow.x[2], yellow.y[2]) == pytest.approx((-10, -20))
+    # There is a single ball, its detections are averaged
+    assert world.ball_detected()
+    assert (world.ball.x[0], world.ball.y[0]) == pytest.approx((200, 10))
+
+    now[0] += 0.5
+    world.update(fusion.fuse()[:0])
+    assert not world.ball_detected()
+    assert blue.is_visible(1) and world.ball.is_visible(0)
+
+    now[0] += 0.6
+    assert not blue.is_visible(1) and not world.ball.is_visible(0)
+    assert blue.n_visible() == 0